@@ -0,0 +1,136 @@
+"""Compile every cv of a multi-cv container file into a pdf, without the GUI:
+
+python batch.py cvs.txt --settings settings/classic.json --workers 4
+"""
+
+import argparse
+import collections
+import re
+import subprocess
+import sys
+
+import txtparse
+import tex
+import compiler
+import fonts
+import texlog
+
+TEMPLATE_PATH = "templates/classic.tex"
+OUTPUT_DIR = "output/batch"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="file of cvs separated by lines of ===")
+    parser.add_argument("--settings", help="settings json; defaults if omitted")
+    parser.add_argument("--template", default=TEMPLATE_PATH)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="concurrent lualatex processes; one per core if omitted",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="only check that the cvs compile, without making pdfs",
+    )
+    args = parser.parse_args(argv)
+
+    if args.settings:
+        settings = tex.Settings.from_json(args.settings)
+    else:
+        settings = tex.Settings()
+    for problem in settings.validate():
+        print(f"Warning: {problem}")
+
+    results = txtparse.parse_many(args.source)
+    print(f"{len(results)} cvs in {args.source}")
+    failures = 0
+    cvs = {}
+    for i, result in enumerate(results):
+        if isinstance(result, txtparse.ParsingError):
+            print(f"FAILED cv {i + 1}: {result}")
+            failures += 1
+        else:
+            cvs[i], _ = result
+    names = _job_names(cvs, len(results))
+    documents = _documents(cvs)
+
+    # have the workers find luaotfload's databases up to date, rather than
+    # all of them rebuilding them at once
+    try:
+        fonts.warm_up([settings.main_font, settings.heading_font, settings.title_font])
+    except (OSError, subprocess.CalledProcessError) as e:
+        print(f"Failed to prepare fonts: {e}")
+
+    # compared with the records of earlier runs to catch layout regressions
+    store = texlog.LogStore()
+    previous = store.latest()
+    records = []
+
+    with compiler.CompileFarm(args.workers, draft=args.validate, store=store) as farm:
+        for cv_id, tex_source in tex.render_many(cvs, settings, args.template):
+            if isinstance(tex_source, tex.RenderError):
+                print(f"FAILED {names[cv_id]}: {tex_source}")
+                failures += 1
+            else:
+                farm.submit(
+                    names[cv_id],
+                    tex_source,
+                    dest_dir=args.output_dir,
+                    document=documents[cv_id],
+                )
+
+        for done, result in enumerate(farm.as_completed(), start=1):
+            status = "ok" if result.ok else "FAILED"
+            passes = f"{result.passes} pass{'es' if result.passes > 1 else ''}"
+            print(f"[{done}] {status} {result.name} ({result.seconds:.1f} s, {passes})")
+            failures += not result.ok
+            record = result.record
+            records.append(record)
+            if record.error:
+                print(f"    {record.error.describe()}")
+            if record.document in previous:
+                for change in texlog.layout_changes(previous[record.document], record):
+                    print(f"    {change}")
+
+    print(texlog.timing_summary(records))
+    if args.validate:
+        print(f"{len(results) - failures} of {len(results)} cvs compile")
+    else:
+        print(
+            f"{len(results) - failures} of {len(results)} cvs compiled"
+            f" into {args.output_dir}"
+        )
+    return 1 if failures else 0
+
+
+def _job_names(cvs: dict[int, txtparse.CV], count: int) -> dict[int, str]:
+    # unique names usable as file names, e.g. "0007_Jane_Doe" for the cv at
+    # position 6 of `count`
+    width = len(str(count))
+    names = {}
+    for i, cv in cvs.items():
+        slug = re.sub(r"[^\w-]+", "_", cv.name).strip("_")
+        names[i] = f"{i + 1:0{width}}_{slug}".rstrip("_")
+    return names
+
+
+def _documents(cvs: dict[int, txtparse.CV]) -> dict[int, str]:
+    # what the compile records of the cvs are kept and compared under: the
+    # name of the cv, as in the gui, which stays the same when cvs are added
+    # to or removed from the file; a name that recurs is told apart by its
+    # occurrence, e.g. "Jane Doe (2)"
+    documents = {}
+    seen = collections.Counter()
+    for i, cv in cvs.items():
+        name = cv.name or "output"
+        seen[name] += 1
+        documents[i] = name if seen[name] == 1 else f"{name} ({seen[name]})"
+    return documents
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import re
+import time
+
+import txtparse
+import tex
+
+TXT_PATH = "tests/sample1.txt"
+
+
+def _multipass_to_latex(s: str):
+    # to_latex as it was before the single-pass tokenizer, for comparison
+    s = s.replace("\\*", '{\\char"002A}')
+    s = re.sub("([_#$%&])", r"\\\1", s)
+    s = s.replace("^", "\\^{}")
+    s = s.replace("~", "\\textasciitilde{}")
+    s = re.sub(r'(^|\s)"', r"\1``", s)
+    s = re.sub(r"(^|\s)'", r"\1`", s)
+    passes = 0
+    while s.count("*") and passes < 3:
+        s = re.sub(r"\*\*([^*]+?)\*\*", r"\\textbf{\1}", s)
+        s = re.sub(r"\*([^*]+?)\*", r"\\emph{\1}", s)
+        passes += 1
+    s = re.sub(r"\[(.+?)\]\((.+?)\)", r"\\href{\2}{\1}", s)
+    return s
+
+
+def _corpus_strings(n_cvs: int) -> list[str]:
+    # every string to_latex gets when rendering `n_cvs` variants of the
+    # sample cv; the variants differ in their descriptions and names only
+    with open(TXT_PATH, encoding="utf-8") as f:
+        cv, _ = txtparse.parse(f.read())
+    strings = []
+    for i in range(n_cvs):
+        strings.append(f"{cv.name} {i}")
+        for edu in cv.education:
+            strings += [edu.school, edu.loc, edu.degree, edu.major, edu.courses]
+        for activity in cv.activities:
+            strings += [activity.role, activity.org, activity.loc]
+            strings += [f"{descr} (#{i})" for descr in activity.descriptions]
+        strings += [award.name for award in cv.awards]
+        strings += [f"{test.name} {test.score}" for test in cv.tests]
+        strings += [skillset.skills for skillset in cv.skillsets]
+    return strings
+
+
+def _time(function, strings: list[str]) -> float:
+    start = time.perf_counter()
+    for s in strings:
+        function(s)
+    return time.perf_counter() - start
+
+
+def bench_to_latex(n_cvs=5000):
+    strings = _corpus_strings(n_cvs)
+    assert [tex.to_latex(s) for s in strings] == [
+        _multipass_to_latex(s) for s in strings
+    ]
+    tex.to_latex.cache_clear()
+    multipass = _time(_multipass_to_latex, strings)
+    uncached = _time(tex.to_latex.__wrapped__, strings)
+    cached = _time(tex.to_latex, strings)
+    print(f"to_latex on {len(strings)} strings of {n_cvs} cvs:")
+    print(f"  multi-pass:              {multipass:.3f} s")
+    print(f"  single-pass:             {uncached:.3f} s")
+    print(f"  single-pass with memo:   {cached:.3f} s")
+    print(f"  {tex.to_latex.cache_info()}")
+
+
+if __name__ == "__main__":
+    bench_to_latex()
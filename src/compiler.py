@@ -0,0 +1,438 @@
+import concurrent.futures
+import contextlib
+import dataclasses
+import functools
+import glob
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import typing
+
+import tex
+import texlog
+
+# name of the source file, and hence of the pdf and log, within a job dir
+JOBNAME = "job"
+
+# the files through which a pass hands cross-references and the pdf outline
+# (from hyperref) on to the next pass; another pass is needed only when a
+# pass changes them
+RERUN_EXTENSIONS = [".aux", ".out"]
+MAX_PASSES = 4
+
+# the lines of the .aux file that the next pass reads back into the
+# document, cross-references and citations, and so can change its line and
+# page breaks; a draft compile needs another pass only if these change
+_AUX_REFERENCES = re.compile(rb"^\\(?:newlabel|bibcite)\b.*$", re.MULTILINE)
+
+# the number of pages, which LaTeX writes to the .aux file (since 2020),
+# and lualatex to the log unless in draft mode
+_AUX_PAGES = re.compile(rb"\\gdef *\\@abspage@last\{(\d+)\}")
+_LOG_PAGES = re.compile(rb"Output written on .*?\((\d+) pages?")
+
+PDF_CACHE_DIR = "pdfs"
+MAX_PDF_CACHE_BYTES = 200 * 1024 * 1024
+
+
+@dataclasses.dataclass
+class CompileResult:
+    name: str
+    returncode: int
+    pdf_path: str  # empty if no pdf was made
+    log_path: str  # empty if the log was not kept
+    seconds: float
+    passes: int = 1
+    draft: bool = False  # checked only, without making a pdf
+    record: texlog.CompileRecord | None = None
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and (self.draft or bool(self.pdf_path))
+
+
+class CompileJob:
+    """A lualatex run in a scratch directory of its own, so that any number
+    of runs can go on at once without overwriting each other's files.
+
+    The job makes as many passes as it takes for the .aux and .out files to
+    settle, which is one if they are seeded with those of a similar earlier
+    job. A draft job only checks that the document compiles and counts its
+    pages, running lualatex in draft mode, which writes no pdf; it makes
+    another pass only if the cross-references in the .aux file change.
+
+    The records of the job (see analyze) are of `document`, by default
+    `name`, by which they are compared with those of earlier compiles.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        document: str = "",
+        scratch_dir: str | None = None,
+        draft: bool = False,
+    ):
+        self.name = name
+        self.document = document or name
+        self.draft = draft
+        if scratch_dir:
+            os.makedirs(scratch_dir, exist_ok=True)
+        self.dir = tempfile.mkdtemp(prefix="job-", dir=scratch_dir)
+        self.tex_path = os.path.join(self.dir, f"{JOBNAME}.tex")
+        self.passes = 0
+        self.pass_seconds = []
+        self._before_pass = {}
+        self._pass_start = 0.0
+
+    def args(self) -> list[str]:
+        # arguments to lualatex, which should run in self.dir
+        args = ["-interaction=nonstopmode", f"{JOBNAME}.tex"]
+        if self.draft:
+            args.insert(0, "-draftmode")
+        return args
+
+    def snapshot(self) -> dict[str, bytes]:
+        """The contents of the .aux and .out files, empty if missing."""
+        snapshot = {}
+        for ext in RERUN_EXTENSIONS:
+            try:
+                with open(os.path.join(self.dir, f"{JOBNAME}{ext}"), "rb") as f:
+                    snapshot[ext] = f.read()
+            except FileNotFoundError:
+                snapshot[ext] = b""
+        return snapshot
+
+    def seed(self, snapshot: dict[str, bytes]):
+        """Start from the .aux and .out files of an earlier job.
+
+        The job may be of another document: a pass rewrites both files from
+        scratch, so whatever in them does not hold for this document changes
+        and calls for another pass (see needs_rerun), which then reads the
+        right ones. So a seed can save passes, but not change the result.
+        """
+        for ext, content in snapshot.items():
+            if content:
+                with open(os.path.join(self.dir, f"{JOBNAME}{ext}"), "wb") as f:
+                    f.write(content)
+
+    def begin_pass(self):
+        """Call before starting lualatex on the job."""
+        self.passes += 1
+        self._before_pass = self.snapshot()
+        self._pass_start = time.perf_counter()
+
+    def end_pass(self):
+        """Call when lualatex has finished a pass."""
+        self.pass_seconds.append(time.perf_counter() - self._pass_start)
+
+    def needs_rerun(self) -> bool:
+        """Whether the pass just made changed what the next pass would read,
+        in which case lualatex should be run again."""
+        if self.passes >= MAX_PASSES:
+            return False
+        after = self.snapshot()
+        if self.draft:
+            # the pdf outline in the .out file, and the page count in the
+            # .aux file, which a draft reports, do not change the document
+            references = _AUX_REFERENCES.findall
+            return references(after[".aux"]) != references(self._before_pass[".aux"])
+        return after != self._before_pass
+
+    def page_count(self) -> int | None:
+        """The number of pages of the document after a pass, or None if it
+        cannot be told."""
+        for ext, pattern in [(".aux", _AUX_PAGES), (".log", _LOG_PAGES)]:
+            try:
+                with open(os.path.join(self.dir, f"{JOBNAME}{ext}"), "rb") as f:
+                    mo = pattern.search(f.read())
+            except FileNotFoundError:
+                continue
+            if mo:
+                return int(mo.group(1))
+        return None
+
+    def analyze(self, returncode: int) -> texlog.CompileRecord:
+        """A record of the job after its last pass, from its log."""
+        log_path = os.path.join(self.dir, f"{JOBNAME}.log")
+        try:
+            with open(log_path, encoding="utf-8", errors="replace") as f:
+                log = f.read()
+            with open(self.tex_path, encoding="utf-8") as f:
+                tex_source = f.read()
+        except FileNotFoundError:
+            log, tex_source = "", ""
+        record = texlog.parse_log(log, tex_source)
+        record.document = self.document
+        record.finished = time.time()
+        record.returncode = returncode
+        record.pass_seconds = list(self.pass_seconds)
+        record.draft = self.draft
+        # the .aux file has the page count in draft mode too
+        record.pages = self.page_count()
+        return record
+
+    def write(self, tex_source: str):
+        with open(self.tex_path, "w", encoding="utf-8") as tex_file:
+            tex_file.write(tex_source)
+
+    def run(self, stdout=subprocess.DEVNULL) -> int:
+        """Run lualatex as many times as needed; return its last exit code."""
+        while True:
+            self.begin_pass()
+            process = subprocess.run(
+                ["lualatex", *self.args()],
+                cwd=self.dir,
+                stdin=subprocess.DEVNULL,
+                stdout=stdout,
+                stderr=subprocess.STDOUT,
+                creationflags=tex.NO_WINDOW,
+            )
+            self.end_pass()
+            if process.returncode or not self.needs_rerun():
+                return process.returncode
+
+    def collect(
+        self,
+        dest_dir: str,
+        *,
+        returncode: int,
+        seconds: float = 0.0,
+        name: str = "",
+        keep_log: bool = True,
+        record: texlog.CompileRecord | None = None,
+    ) -> CompileResult:
+        """Move the pdf and log, named after `name` (or else the job), to
+        `dest_dir`."""
+        name = name or self.name
+        os.makedirs(dest_dir, exist_ok=True)
+        paths = {}
+        for ext in [".pdf", ".log"] if keep_log else [".pdf"]:
+            src_path = os.path.join(self.dir, f"{JOBNAME}{ext}")
+            dest_path = os.path.join(dest_dir, f"{name}{ext}")
+            try:
+                shutil.move(src_path, dest_path)
+            except FileNotFoundError:
+                dest_path = ""
+            paths[ext] = dest_path
+        return CompileResult(
+            name=name,
+            returncode=returncode,
+            pdf_path=paths[".pdf"],
+            log_path=paths.get(".log", ""),
+            seconds=seconds,
+            passes=self.passes,
+            draft=self.draft,
+            record=record,
+        )
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class CompileFarm:
+    """Compile documents on up to `workers` concurrent lualatex processes.
+
+    with CompileFarm(workers=4) as farm:
+        for name, tex_source in documents:
+            farm.submit(name, tex_source, dest_dir="output/batch")
+        for result in farm.as_completed():
+            print(result.name, result.ok)
+
+    With `draft`, the documents are only checked, and no pdfs are made. A
+    record of each compile (see texlog) comes with its result, and is added
+    to `store` if given.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        *,
+        scratch_dir: str | None = None,
+        draft: bool = False,
+        store: texlog.LogStore | None = None,
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.scratch_dir = scratch_dir
+        self.draft = draft
+        self.store = store
+        # .aux and .out files of the last job to succeed, of whichever
+        # document (see CompileJob.seed); documents from one template mostly
+        # agree in these, so a job seeded with them tends to need a single pass
+        self._seed = {}
+        # lualatex does the work; a thread only waits for its process
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.workers, thread_name_prefix="lualatex"
+        )
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def submit(
+        self, name: str, tex_source: str, dest_dir: str, *, document: str = ""
+    ) -> concurrent.futures.Future:
+        """Compile `tex_source` into `dest_dir`/`name`.pdf (unless this is a
+        draft farm), with the log beside it; the future gives a
+        CompileResult. The record of the compile is of `document`, by
+        default `name`."""
+        future = self._executor.submit(
+            self._compile, name, tex_source, dest_dir, document
+        )
+        self._futures.append(future)
+        return future
+
+    def as_completed(self) -> typing.Iterator[CompileResult]:
+        """Yield the results of the jobs submitted so far as they finish."""
+        futures, self._futures = self._futures, []
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+    def shutdown(self, *, cancel: bool = False):
+        self._executor.shutdown(wait=True, cancel_futures=cancel)
+
+    def _compile(
+        self, name: str, tex_source: str, dest_dir: str, document: str
+    ) -> CompileResult:
+        job = CompileJob(
+            name,
+            document=document,
+            scratch_dir=self.scratch_dir,
+            draft=self.draft,
+        )
+        try:
+            job.write(tex_source)
+            job.seed(self._seed)
+            start = time.perf_counter()
+            returncode = job.run()
+            seconds = time.perf_counter() - start
+            if returncode == 0:
+                self._seed = job.snapshot()
+            record = job.analyze(returncode)
+            if self.store:
+                self.store.add(record)
+            return job.collect(
+                dest_dir, returncode=returncode, seconds=seconds, record=record
+            )
+        finally:
+            job.cleanup()
+
+
+class PdfCache:
+    """Compiled pdfs kept by the hash of what went into them, so that
+    compiling an unchanged document again costs a file copy. The least
+    recently used pdfs are dropped once the cache outgrows `max_bytes`.
+
+    key = cache.key(tex_path, template_path=template_path)
+    if (pdf_path := cache.get(key)) is None:
+        ...  # compile tex_path
+        cache.put(key, compiled_pdf_path)
+    """
+
+    def __init__(
+        self, cache_dir: str = PDF_CACHE_DIR, max_bytes: int = MAX_PDF_CACHE_BYTES
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, tex_path: str, *, template_path: str) -> str:
+        """The key of the pdf compiled from the document at `tex_path`."""
+        # The document is the rendered template, but the template may also
+        # \input files of its own; and the same document compiles into a
+        # different pdf after lualatex or the installed fonts change
+        digest = hashlib.sha256()
+        digest.update(f"{tex.lualatex_version()}\n".encode("utf-8"))
+        digest.update(f"{font_database_identity()}\n".encode("utf-8"))
+        for path in [template_path, tex_path]:
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """The path of the cached pdf for `key`, or None if there is none."""
+        path = self._path(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key: str, pdf_path: str) -> str:
+        """Copy the pdf at `pdf_path` into the cache under `key`."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        # copy under a name of its own, so that no reader sees half a pdf
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.cache_dir)
+        os.close(fd)
+        try:
+            shutil.copyfile(pdf_path, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+        self._prune(keep=path)
+        return path
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses ({self.hit_rate:.0%} hit rate)"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def _prune(self, *, keep: str):
+        # drop the least recently used pdfs beyond the size limit, but not
+        # the one at `keep`, just added, even if it alone is over the limit
+        entries = [
+            entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".pdf")
+        ]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        total = 0
+        for entry in entries:
+            total += entry.stat().st_size
+            if total > self.max_bytes and entry.path != keep:
+                with contextlib.suppress(OSError):
+                    os.remove(entry.path)
+
+
+def font_database_identity() -> str:
+    """The size and modification time of each file of luaotfload's font
+    name database, which is updated when fonts are installed or removed."""
+    names_dir = _luaotfload_names_dir()
+    if not names_dir:
+        return ""
+    stamps = []
+    for path in sorted(glob.glob(os.path.join(names_dir, "*"))):
+        with contextlib.suppress(OSError):
+            stat = os.stat(path)
+            stamps.append(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return " ".join(stamps)
+
+
+@functools.cache
+def _luaotfload_names_dir() -> str:
+    try:
+        process = subprocess.run(
+            ["kpsewhich", "-var-value=TEXMFVAR"],
+            capture_output=True,
+            text=True,
+            creationflags=tex.NO_WINDOW,
+        )
+    except OSError:
+        return ""
+    texmfvar = process.stdout.strip()
+    return os.path.join(texmfvar, "luaotfload", "names") if texmfvar else ""
@@ -0,0 +1,137 @@
+import dataclasses
+import datetime
+import re
+import typing
+
+import numpy as np
+
+from txtparse import CV, SmartDate
+
+# a number at the start of a field, e.g. "112" in "112 (28/27/29/28)"
+_LEADING_NUMBER = re.compile(r"^\s*(\d+(?:\.\d*)?|\.\d+)")
+
+
+@dataclasses.dataclass
+class Columns:
+    """Columns of one type of entry. Row i belongs to the cv `owner[i]` of
+    the table, and the rows of the j-th cv are `offsets[j]:offsets[j + 1]`.
+    """
+
+    owner: np.ndarray
+    offsets: np.ndarray
+    columns: dict[str, np.ndarray]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.owner)
+
+
+class CorpusTable:
+    """The entries of many cvs held in NumPy columns, for vectorized queries.
+
+    Dates are `datetime64[D]` (the first of the month or year if no day or
+    month is given), and hours, weeks, scores and gpas are floats; all of
+    them are NaT or NaN where the field is blank or does not parse.
+
+    Students with a TOEFL score of at least 105 and over 500 activity hours:
+
+        table = CorpusTable(cvs)
+        tests, activities = table.tests, table.activities
+        good_toefl = (tests["name"] == "TOEFL") & (tests["score"] >= 105)
+        has_good_toefl = table.any_per_cv(tests, good_toefl)
+        hours = table.sum_per_cv(activities, activities["total_hours"])
+        matches = table.select(has_good_toefl & (hours > 500))
+    """
+
+    def __init__(self, cvs: typing.Iterable[CV]):
+        self.cvs = list(cvs)
+        self.names = np.array([cv.name for cv in self.cvs], dtype=str)
+
+        self.education = self._build(
+            [cv.education for cv in self.cvs],
+            school=(str, lambda e: e.school),
+            start_date=("datetime64[D]", lambda e: _to_date(e.start_date)),
+            end_date=("datetime64[D]", lambda e: _to_date(e.end_date)),
+            gpa=(float, lambda e: _to_number(e.gpa)),
+        )
+        self.activities = self._build(
+            [cv.activities for cv in self.cvs],
+            role=(str, lambda a: a.role),
+            org=(str, lambda a: a.org),
+            section=(str, lambda a: a.section),
+            start_date=("datetime64[D]", lambda a: _to_date(a.start_date)),
+            end_date=("datetime64[D]", lambda a: _to_date(a.end_date)),
+            hours_per_week=(float, lambda a: _to_number(a.hours_per_week)),
+            weeks_per_year=(float, lambda a: _to_number(a.weeks_per_year)),
+        )
+        self.activities.columns["total_hours"] = (
+            self.activities["hours_per_week"] * self.activities["weeks_per_year"]
+        )
+        self.awards = self._build(
+            [cv.awards for cv in self.cvs],
+            name=(str, lambda a: a.name),
+            date=("datetime64[D]", lambda a: _to_date(a.date)),
+        )
+        self.tests = self._build(
+            [cv.tests for cv in self.cvs],
+            name=(str, lambda t: t.name),
+            score=(float, lambda t: _to_number(t.score)),
+            date=("datetime64[D]", lambda t: _to_date(t.date)),
+        )
+        self.skillsets = self._build(
+            [cv.skillsets for cv in self.cvs],
+            name=(str, lambda s: s.name),
+            skills=(str, lambda s: s.skills),
+        )
+
+    def __len__(self):
+        return len(self.cvs)
+
+    @staticmethod
+    def _build(entry_lists: list[list], **specs) -> Columns:
+        # specs: column name -> (dtype, function getting the value of an entry)
+        counts = np.array([len(entries) for entries in entry_lists], dtype=np.intp)
+        offsets = np.zeros(len(counts) + 1, dtype=np.intp)
+        np.cumsum(counts, out=offsets[1:])
+        owner = np.repeat(np.arange(len(counts), dtype=np.intp), counts)
+        entries = [entry for entries in entry_lists for entry in entries]
+        columns = {
+            name: np.array([getter(entry) for entry in entries], dtype=dtype)
+            for name, (dtype, getter) in specs.items()
+        }
+        return Columns(owner=owner, offsets=offsets, columns=columns)
+
+    def any_per_cv(self, entries: Columns, mask: np.ndarray) -> np.ndarray:
+        """Whether each cv has any entry for which `mask` is true."""
+        return np.bincount(entries.owner[mask], minlength=len(self)) > 0
+
+    def sum_per_cv(self, entries: Columns, values: np.ndarray) -> np.ndarray:
+        """The sum of `values` over the entries of each cv; NaNs count as 0."""
+        return np.bincount(
+            entries.owner, weights=np.nan_to_num(values), minlength=len(self)
+        )
+
+    def max_per_cv(self, entries: Columns, values: np.ndarray) -> np.ndarray:
+        """The maximum of `values` over the entries of each cv, ignoring NaNs;
+        NaN for cvs without such values."""
+        result = np.full(len(self), np.nan)
+        np.fmax.at(result, entries.owner, values)
+        return result
+
+    def select(self, mask: np.ndarray) -> list[CV]:
+        """The cvs for which `mask`, an array with one value per cv, is true."""
+        return [self.cvs[i] for i in np.flatnonzero(mask)]
+
+
+def _to_date(d: SmartDate) -> datetime.date | None:
+    if not d.is_date or not d.year:
+        return None
+    return datetime.date(d.year, d.month or 1, d.day or 1)
+
+
+def _to_number(s: str) -> float:
+    if mo := _LEADING_NUMBER.match(s):
+        return float(mo.group(1))
+    return np.nan
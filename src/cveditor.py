@@ -9,39 +9,9 @@ from PyQt6.QtGui import (
     QColor,
 )
 
+import txtparse
 
-KEYWORDS = sorted(
-    [
-        "name",
-        "email",
-        "phone",
-        "address",
-        "website",
-        "loc",
-        r"start\s+date",
-        r"end\s+date",
-        "school",
-        "degree",
-        "major",
-        "minor",
-        "gpa",
-        "rank",
-        "courses",
-        "role",
-        "org",
-        r"hours\s+per\s+week",
-        r"weeks\s+per\s+year",
-        "test",
-        "score",
-        r"test\s+date",
-        "award",
-        r"award\s+date",
-        r"skillset\s+name",
-        "skills",
-    ],
-    key=len,
-    reverse=True,
-)
+KEYWORDS = txtparse.KEYWORD_PATTERNS
 
 _DATE_KEYWORDS = [kw for kw in KEYWORDS if kw.endswith("date")]
 
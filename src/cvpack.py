@@ -0,0 +1,269 @@
+import array
+import dataclasses
+import itertools
+import struct
+import sys
+import typing
+import zlib
+
+import txtparse
+from txtparse import CV, SmartDate
+
+# Layout of a packed corpus (all integers little-endian):
+#
+#   header   magic, format version, schema id, and the numbers of strings,
+#            dates, cvs and body items
+#   strings  the length of each distinct string, then all of them joined
+#            and encoded as utf-8
+#   dates    the years, months, days and fallbacks (string numbers) of
+#            each distinct date, as four arrays
+#   body     one array of unsigned ints holding, for each model class in
+#            turn, the number of its objects followed by one column per
+#            field: string numbers for a string field, date numbers for a
+#            date field, and lengths for a list field, followed by the
+#            string numbers of the items for a list of strings; the items
+#            of a list of entries are the objects of the entry class
+#
+# Bump FORMAT_VERSION whenever the layout changes; changes to the fields
+# of the cv model change the schema id. Either makes older data unloadable.
+MAGIC = b"MLCV"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHIIIII")
+
+# stand-in for a missing year, month or day
+_NO_YEAR = 0xFFFF
+_NO_MONTH_OR_DAY = 0
+
+# typecodes of the arrays of unsigned ints of 1, 2 and 4 bytes; the sizes
+# of the C types behind the typecodes vary by platform
+_UINT8, _UINT16, _UINT32 = (
+    next(code for code in "BHILQ" if array.array(code).itemsize == size)
+    for size in [1, 2, 4]
+)
+
+# kinds of fields
+_STR, _DATE, _STR_LIST, _ENTRY_LIST = range(4)
+
+
+class FormatError(ValueError):
+    pass
+
+
+def _layout(cls) -> tuple[tuple[str, int, typing.Any], ...]:
+    # (name, kind, list type and entry class) of each field of a model class
+    layout = []
+    for field in dataclasses.fields(cls):
+        if not field.init:
+            continue
+        if field.type is str:
+            layout.append((field.name, _STR, None))
+        elif field.type is SmartDate:
+            layout.append((field.name, _DATE, None))
+        elif field.type == list[str]:
+            layout.append((field.name, _STR_LIST, None))
+        else:
+            (entry_class,) = typing.get_args(field.type)
+            # e.g. CV.education is held in an indexed list
+            list_type = field.default_factory
+            layout.append((field.name, _ENTRY_LIST, (list_type, entry_class)))
+    return tuple(layout)
+
+
+# entry classes come before the cv, whose lists of entries refer to them
+_MODEL_CLASSES = [*txtparse.ENTRY_CLASSES, CV]
+_LAYOUTS = {cls: _layout(cls) for cls in _MODEL_CLASSES}
+_SCHEMA_ID = zlib.crc32(
+    repr(
+        [
+            (cls.__name__, [(name, kind) for name, kind, _ in _LAYOUTS[cls]])
+            for cls in _MODEL_CLASSES
+        ]
+    ).encode()
+)
+
+
+def dumps(cvs: typing.Iterable[CV]) -> bytes:
+    """Pack cvs into bytes that `loads` turns back into equal cvs."""
+    strings = {}
+    dates = {}
+    body = array.array(_UINT32)
+
+    def string_number(s: str) -> int:
+        try:
+            return strings[s]
+        except KeyError:
+            return strings.setdefault(s, len(strings))
+
+    def date_number(d: SmartDate) -> int:
+        try:
+            return dates[d]
+        except KeyError:
+            string_number(d.fallback)
+            return dates.setdefault(d, len(dates))
+
+    # model class -> its objects, in the order of the cvs and their lists
+    objects = {cls: [] for cls in _MODEL_CLASSES}
+    objects[CV] = cvs = list(cvs)
+    for cv in cvs:
+        for name, kind, arg in _LAYOUTS[CV]:
+            if kind == _ENTRY_LIST:
+                _, entry_class = arg
+                objects[entry_class].extend(getattr(cv, name))
+
+    for cls in _MODEL_CLASSES:
+        body.append(len(objects[cls]))
+        for name, kind, _ in _LAYOUTS[cls]:
+            values = [getattr(obj, name) for obj in objects[cls]]
+            if kind == _STR:
+                body.extend(map(string_number, values))
+            elif kind == _DATE:
+                body.extend(map(date_number, values))
+            else:
+                body.extend(map(len, values))
+                if kind == _STR_LIST:
+                    for value in values:
+                        body.extend(map(string_number, value))
+
+    lengths = array.array(_UINT32, (len(s) for s in strings))
+    text = "".join(strings).encode("utf-8", errors="surrogatepass")
+    years = array.array(
+        _UINT16, (_NO_YEAR if d.year is None else d.year for d in dates)
+    )
+    months = array.array(_UINT8, (d.month or _NO_MONTH_OR_DAY for d in dates))
+    days = array.array(_UINT8, (d.day or _NO_MONTH_OR_DAY for d in dates))
+    fallbacks = array.array(_UINT32, (strings[d.fallback] for d in dates))
+
+    header = _HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        _SCHEMA_ID,
+        len(strings),
+        len(dates),
+        len(cvs),
+        len(body),
+    )
+    return b"".join(
+        [
+            header,
+            _little_endian(lengths),
+            struct.pack("<I", len(text)),
+            text,
+            *map(_little_endian, [years, months, days, fallbacks, body]),
+        ]
+    )
+
+
+def loads(data: bytes) -> list[CV]:
+    """Unpack the cvs packed by `dumps`."""
+    data = memoryview(data)
+    try:
+        magic, version, schema_id, n_strings, n_dates, n_cvs, n_body = (
+            _HEADER.unpack_from(data)
+        )
+    except struct.error:
+        raise FormatError("Truncated header")
+    if magic != MAGIC:
+        raise FormatError("Not a packed cv file")
+    if version != FORMAT_VERSION:
+        raise FormatError(f"Unsupported format version: {version}")
+    if schema_id != _SCHEMA_ID:
+        raise FormatError("Packed with a different cv model")
+
+    try:
+        offset = _HEADER.size
+        lengths, offset = _read_array(data, offset, _UINT32, n_strings)
+        (text_size,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        text = str(data[offset : offset + text_size], "utf-8", "surrogatepass")
+        offset += text_size
+        years, offset = _read_array(data, offset, _UINT16, n_dates)
+        months, offset = _read_array(data, offset, _UINT8, n_dates)
+        days, offset = _read_array(data, offset, _UINT8, n_dates)
+        fallbacks, offset = _read_array(data, offset, _UINT32, n_dates)
+        body, offset = _read_array(data, offset, _UINT32, n_body)
+    except (struct.error, ValueError):
+        raise FormatError("Truncated data")
+
+    bounds = list(itertools.accumulate(lengths, initial=0))
+    strings = list(map(text.__getitem__, map(slice, bounds, bounds[1:])))
+
+    dates = []
+    objects = {}
+    try:
+        for year, month, day, fallback in zip(years, months, days, fallbacks):
+            date = SmartDate(
+                year=None if year == _NO_YEAR else year,
+                month=month or None,
+                day=day or None,
+                fallback=strings[fallback],
+            )
+            # share the instances of dates that have been parsed
+            dates.append(txtparse.intern_date(date))
+
+        position = 0
+        for cls in _MODEL_CLASSES:
+            count = body[position]
+            position += 1
+            columns = []
+            for _, kind, arg in _LAYOUTS[cls]:
+                column = body[position : position + count]
+                position += count
+                if kind == _STR:
+                    columns.append(map(strings.__getitem__, column))
+                elif kind == _DATE:
+                    columns.append(map(dates.__getitem__, column))
+                elif kind == _STR_LIST:
+                    n_items = sum(column)
+                    items = body[position : position + n_items]
+                    position += n_items
+                    items = map(strings.__getitem__, items)
+                    columns.append([list(itertools.islice(items, n)) for n in column])
+                else:
+                    list_type, entry_class = arg
+                    entries = iter(objects[entry_class])
+                    columns.append(
+                        [list_type(itertools.islice(entries, n)) for n in column]
+                    )
+            objects[cls] = list(map(cls, *columns))
+    except IndexError:
+        raise FormatError("Corrupt data")
+    if position != len(body) or len(objects[CV]) != n_cvs:
+        raise FormatError("Corrupt data")
+    return objects[CV]
+
+
+def dump(cvs: typing.Iterable[CV], path: str):
+    with open(path, "wb") as f:
+        f.write(dumps(cvs))
+
+
+def load(path: str) -> list[CV]:
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def dumps_cv(cv: CV) -> bytes:
+    return dumps([cv])
+
+
+def loads_cv(data: bytes) -> CV:
+    (cv,) = loads(data)
+    return cv
+
+
+def _little_endian(arr: array.array) -> bytes:
+    if sys.byteorder == "big":
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _read_array(data, offset: int, typecode: str, count: int):
+    arr = array.array(typecode)
+    end = offset + arr.itemsize * count
+    if end > len(data):
+        raise FormatError("Truncated data")
+    arr.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr, end
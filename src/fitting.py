@@ -0,0 +1,118 @@
+import dataclasses
+import hashlib
+import typing
+
+import compiler
+import tex
+from txtparse import CV
+
+# The spacing settings that fitting may tighten, and how far: each goes
+# from its value in the given settings (if looser) to the limit here
+SPACING_LIMITS = {
+    "top_margin_in_inch": 0.5,
+    "line_spread": 0.9,
+    "entry_skip_in_pt": 2,
+    "font_size_in_point": 10,
+}
+
+# tightness is searched in steps of 1 / FIT_STEPS, i.e. in at most
+# log2(FIT_STEPS) compiles once both ends are measured
+FIT_STEPS = 16
+
+
+class FitError(Exception):
+    pass
+
+
+class PageCounter:
+    """Count the pages of cvs rendered with a template, with draft compiles,
+    which write no pdf. Counts are remembered by the rendered document, so
+    measuring the same settings again costs a render only."""
+
+    def __init__(self, template_path: str):
+        self.template_path = template_path
+        self.compiles = 0
+        self._counts = {}
+        # with the .aux file of the last compile, a compile mostly needs a
+        # single pass (see compiler.CompileJob)
+        self._seed = {}
+
+    def count(self, cv: CV, settings: tex.Settings) -> int:
+        tex_source = tex.render(
+            template_path=self.template_path, cv=cv, settings=settings
+        )
+        key = hashlib.sha256(tex_source.encode("utf-8")).digest()
+        if key not in self._counts:
+            self._counts[key] = self._compile(tex_source)
+        return self._counts[key]
+
+    def _compile(self, tex_source: str) -> int:
+        job = compiler.CompileJob("count", draft=True)
+        try:
+            job.write(tex_source)
+            job.seed(self._seed)
+            self.compiles += 1
+            if job.run():
+                raise FitError("The cv does not compile; run LaTeX to see why")
+            self._seed = job.snapshot()
+            pages = job.page_count()
+        finally:
+            job.cleanup()
+        if pages is None:
+            raise FitError("Cannot tell the number of pages")
+        return pages
+
+
+def tightened(settings: tex.Settings, tightness: float) -> tex.Settings:
+    """`settings` with the spacing settings moved `tightness` (from 0 to 1)
+    of the way to their limits."""
+    changes = {}
+    for name, limit in SPACING_LIMITS.items():
+        value = getattr(settings, name)
+        if value <= limit:
+            continue
+        new_value = value + (limit - value) * tightness
+        # as precise as the setting widgets
+        changes[name] = (
+            round(new_value) if isinstance(value, int) else round(new_value, 2)
+        )
+    return dataclasses.replace(settings, **changes)
+
+
+def fit_to_pages(
+    cv: CV,
+    settings: tex.Settings,
+    *,
+    pages: int = 1,
+    counter: PageCounter,
+    progress: typing.Callable[[str], None] = print,
+) -> tuple[tex.Settings, int]:
+    """The loosest spacing, no looser than `settings`, with which `cv` takes
+    up at most `pages` pages, found by binary search; and the number of
+    pages it takes up. If the cv does not fit even at the limits of
+    SPACING_LIMITS, return the tightest settings and their page count.
+
+    Raise FitError if the cv does not compile.
+    """
+
+    def measure(step: int) -> int:
+        count = counter.count(cv, tightened(settings, step / FIT_STEPS))
+        progress(f"Tightness {step}/{FIT_STEPS}: {count} page(s)")
+        return count
+
+    # the invariant: `fits` is the loosest step known to fit
+    loosest_count = measure(0)
+    if loosest_count <= pages:
+        return settings, loosest_count
+    fits, fit_count = FIT_STEPS, measure(FIT_STEPS)
+    if fit_count > pages:
+        return tightened(settings, 1), fit_count
+    too_loose = 0
+    while fits - too_loose > 1:
+        step = (too_loose + fits) // 2
+        count = measure(step)
+        if count <= pages:
+            fits, fit_count = step, count
+        else:
+            too_loose = step
+    return tightened(settings, fits / FIT_STEPS), fit_count
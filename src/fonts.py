@@ -0,0 +1,300 @@
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import tex
+
+# Kept across runs, so that only fonts installed or changed since the last
+# run need to be read
+FONT_INDEX_PATH = "config/fonts.json"
+INDEX_VERSION = 1
+
+# OpenType and TrueType fonts, single or in collections; lualatex cannot use
+# bitmap (.fon) fonts, which is what makes e.g. MS Sans Serif fail with
+# "invalid font identifier"
+FONT_EXTENSIONS = {".otf", ".ttf", ".otc", ".ttc"}
+_SFNT_TAGS = {b"\x00\x01\x00\x00", b"OTTO", b"true"}
+_COLLECTION_TAG = b"ttcf"
+
+# family, full name and typographic family
+_NAME_IDS = {1, 4, 16}
+_FAMILY, _FULL_NAME, _TYPOGRAPHIC_FAMILY = 1, 4, 16
+# English names: Windows platform with US English, or Mac platform with
+# English; fontspec is not given names in other languages
+_ENGLISH = {(3, 0x409), (1, 0)}
+
+
+class FontIndex:
+    """The families of the fonts lualatex can load by name or file name, as
+    found in the font directories of the system and of the TeX trees."""
+
+    def __init__(self, entries: dict[str, tuple[int, int, list[str]]] = None):
+        # font file path -> (size, mtime in ns, names in the file); the
+        # first name of a file is its family, which the pickers show
+        self.entries = entries or {}
+        self.families = sorted(
+            {names[0] for _, _, names in self.entries.values() if names},
+            key=str.casefold,
+        )
+        self._names = {
+            _normalize(name) for _, _, names in self.entries.values() for name in names
+        }
+        # fontspec also takes file names, e.g. "EBGaramond-Regular.otf", which
+        # luaotfload finds with or without the extension
+        for path in self.entries:
+            filename = os.path.basename(path)
+            self._names.add(_normalize(filename))
+            self._names.add(_normalize(os.path.splitext(filename)[0]))
+
+    def __contains__(self, name: str) -> bool:
+        # luaotfload matches names regardless of case and spaces
+        return _normalize(name) in self._names
+
+    def __len__(self):
+        return len(self.families)
+
+    @classmethod
+    def load(cls, path: str = FONT_INDEX_PATH) -> "FontIndex":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError("Unsupported font index version")
+        return cls({path: tuple(entry) for path, entry in data["fonts"].items()})
+
+    def save(self, path: str = FONT_INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "fonts": self.entries}, f)
+        os.replace(tmp_path, path)
+
+
+def build_index(
+    dirs: typing.Iterable[str] | None = None, previous: FontIndex | None = None
+) -> FontIndex:
+    """Index the fonts in `dirs` (by default, `font_dirs()`), reading only
+    the files that are new or changed since `previous` was built."""
+    old_entries = previous.entries if previous else {}
+    entries = {}
+    for path in _font_files(font_dirs() if dirs is None else dirs):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        old = old_entries.get(path)
+        if old and old[:2] == (stat.st_size, stat.st_mtime_ns):
+            entries[path] = old
+            continue
+        try:
+            names = read_font_names(path)
+        except (OSError, struct.error, ValueError):
+            names = []
+        entries[path] = (stat.st_size, stat.st_mtime_ns, names)
+    return FontIndex(entries)
+
+
+def read_font_names(path: str) -> list[str]:
+    """The English family, typographic family and full names of the fonts in
+    an OpenType/TrueType file or collection, the family first."""
+    # only the table directories and the name tables are read, as fonts,
+    # CJK ones in particular, can be tens of megabytes
+    with open(path, "rb") as f:
+        tag = f.read(4)
+        if tag == _COLLECTION_TAG:
+            (n_fonts,) = struct.unpack(">4xI", f.read(8))
+            offsets = struct.unpack(f">{n_fonts}I", f.read(4 * n_fonts))
+        elif tag in _SFNT_TAGS:
+            offsets = [0]
+        else:
+            raise ValueError(f"Not an OpenType or TrueType font: {path}")
+        name_tables = [_read_name_table(f, offset) for offset in offsets]
+
+    names = {}  # insertion-ordered, without duplicates
+    for found in name_tables:
+        # a typographic family groups more than four styles, which the
+        # family names then tell apart, e.g. "Source Sans Pro Semibold"
+        family = found.get(_TYPOGRAPHIC_FAMILY) or found.get(_FAMILY)
+        for name in [family, found.get(_FAMILY), found.get(_FULL_NAME)]:
+            if name:
+                names[name] = None
+    return list(names)
+
+
+def _read_name_table(f: typing.BinaryIO, offset: int) -> dict[int, str]:
+    # name id -> English name, from the font whose table directory is at
+    # `offset`
+    f.seek(offset + 4)
+    (n_tables,) = struct.unpack(">H", f.read(2))
+    f.seek(offset + 12)
+    directory = f.read(16 * n_tables)
+    for table_tag, _, table_offset, table_length in struct.iter_unpack(
+        ">4sIII", directory
+    ):
+        if table_tag == b"name":
+            break
+    else:
+        return {}
+
+    f.seek(table_offset)
+    data = f.read(table_length)
+    _, count, strings = struct.unpack_from(">HHH", data)
+    found = {}
+    for i in range(count):
+        platform, encoding, language, name_id, length, start = struct.unpack_from(
+            ">HHHHHH", data, 6 + 12 * i
+        )
+        if name_id not in _NAME_IDS or (platform, language) not in _ENGLISH:
+            continue
+        raw = data[strings + start : strings + start + length]
+        name = raw.decode("utf-16-be" if platform == 3 else "mac-roman").strip()
+        # prefer the Windows names, which come after the Mac ones
+        if name and (platform == 3 or name_id not in found):
+            found[name_id] = name
+    return found
+
+
+def font_dirs() -> list[str]:
+    """Where lualatex looks for fonts: the system and user font directories,
+    OSFONTDIR, and the OpenType and TrueType fonts of the TeX trees."""
+    home = os.path.expanduser("~")
+    if sys.platform == "win32":
+        windir = os.environ.get("WINDIR", r"C:\Windows")
+        local = os.environ.get("LOCALAPPDATA", "")
+        dirs = [os.path.join(windir, "Fonts")]
+        if local:
+            dirs.append(os.path.join(local, "Microsoft", "Windows", "Fonts"))
+    elif sys.platform == "darwin":
+        dirs = [
+            "/System/Library/Fonts",
+            "/Library/Fonts",
+            os.path.join(home, "Library", "Fonts"),
+        ]
+    else:
+        dirs = [
+            "/usr/share/fonts",
+            "/usr/local/share/fonts",
+            os.path.join(home, ".fonts"),
+            os.path.join(home, ".local", "share", "fonts"),
+        ]
+    # the distribution, site-wide and per-user TeX trees, and the system
+    # font directories as the TeX distribution is configured to see them
+    for tree in _kpse_dirs("$TEXMFDIST", "$TEXMFLOCAL", "$TEXMFHOME"):
+        dirs += [
+            os.path.join(tree, "fonts", "opentype"),
+            os.path.join(tree, "fonts", "truetype"),
+        ]
+    dirs += _kpse_dirs("$OSFONTDIR")
+    return list(dict.fromkeys(os.path.normpath(d) for d in dirs))
+
+
+def _kpse_dirs(*variables: str) -> list[str]:
+    # the directories the kpathsea `variables` expand to, e.g. "$TEXMFHOME"
+    # to "~/texmf"; "!!" (search the ls-R database only) and "//" (search
+    # subdirectories) do not matter to a directory walk
+    try:
+        process = subprocess.run(
+            ["kpsewhich", f"-expand-braces={os.pathsep.join(variables)}"],
+            capture_output=True,
+            text=True,
+            creationflags=tex.NO_WINDOW,
+        )
+    except OSError:
+        return []
+    dirs = []
+    for entry in process.stdout.strip().split(os.pathsep):
+        entry = entry.removeprefix("!!").rstrip("/")
+        # an unset variable is left as is
+        if entry and "$" not in entry and os.path.isdir(entry):
+            dirs.append(entry)
+    return dirs
+
+
+def _font_files(dirs: typing.Iterable[str]) -> typing.Iterator[str]:
+    for top in dirs:
+        for dirpath, _, filenames in os.walk(top):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in FONT_EXTENSIONS:
+                    yield os.path.join(dirpath, filename)
+
+
+def _normalize(name: str) -> str:
+    return "".join(name.split()).casefold()
+
+
+def warm_up(
+    families: typing.Iterable[str], *, progress: typing.Callable[[str], None] = print
+) -> list[str]:
+    """Bring luaotfload's font name database and font cache up to date for
+    `families`, which a compile would otherwise do first, taking minutes on
+    a new machine or after fonts are installed. Report the steps through
+    `progress` and return the families lualatex still cannot find.
+
+    Raise OSError if luaotfload-tool or lualatex cannot be run, and
+    subprocess.CalledProcessError if updating the database fails.
+    """
+    start = time.perf_counter()
+    families = [family for family in dict.fromkeys(families) if family]
+
+    # looking a font up is quick, and builds the database if there is none
+    progress("Checking the font name database...")
+    missing = [family for family in families if not _luaotfload_find(family)]
+    if missing:
+        progress(
+            f"Not in the database: {', '.join(missing)}; updating it,"
+            " which may take a few minutes..."
+        )
+        subprocess.run(
+            ["luaotfload-tool", "--update"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            creationflags=tex.NO_WINDOW,
+        )
+        missing = [family for family in missing if not _luaotfload_find(family)]
+        for family in missing:
+            progress(f"Font not found: {family}")
+
+    # loading a font the first time writes it to luaotfload's font cache
+    found = [family for family in families if family not in missing]
+    progress(f"Loading {', '.join(found or ['the default font'])}...")
+    _load_fonts(found)
+
+    progress(f"Fonts ready ({time.perf_counter() - start:.1f} s)")
+    return missing
+
+
+def _luaotfload_find(family: str) -> bool:
+    process = subprocess.run(
+        ["luaotfload-tool", f"--find={family}"],
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        errors="replace",
+        creationflags=tex.NO_WINDOW,
+    )
+    return process.returncode == 0 and "Cannot find" not in process.stdout
+
+
+def _load_fonts(families: list[str]):
+    # a letter in the default font and in each of `families`, compiled in
+    # draft mode, which writes no pdf
+    lines = [r"\documentclass{article}", r"\usepackage{fontspec}", r"\begin{document}"]
+    lines += ["x", *(rf"{{\fontspec{{{family}}}x}}" for family in families)]
+    lines.append(r"\end{document}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, "fonts.tex"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        subprocess.run(
+            ["lualatex", "-draftmode", "-interaction=nonstopmode", "fonts.tex"],
+            cwd=tmpdir,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            creationflags=tex.NO_WINDOW,
+        )
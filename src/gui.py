@@ -1,4 +1,5 @@
 import os
+import copy
 import traceback
 import dataclasses
 import json
@@ -6,8 +7,9 @@ import time
 import datetime
 import html
 import csv
+import shutil
 
-from PyQt6.QtCore import Qt, QProcess, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QProcess, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import (
     QAction,
     QFont,
@@ -22,6 +24,7 @@ from PyQt6.QtWidgets import (
     QMenu,
     QPlainTextEdit,
     QTextEdit,
+    QTextBrowser,
     QFrame,
     QDialog,
     QScrollArea,
@@ -38,6 +41,7 @@ from PyQt6.QtWidgets import (
     QCheckBox,
     QLineEdit,
     QFileDialog,
+    QInputDialog,
     QMessageBox,
     QSpacerItem,
 )
@@ -45,6 +49,11 @@ from PyQt6.QtWidgets import (
 import txtparse
 import docparse
 import tex
+import compiler
+import fitting
+import fonts
+import htmlpreview
+import texlog
 import chat
 import excel
 from cveditor import CvEditor
@@ -57,6 +66,11 @@ LAST_USED_SETTINGS = f"{SETTINGS_DIR}/last_used.json"
 CONFIG_DIR = "config"
 LAST_USED_CONFIG = f"{CONFIG_DIR}/last_used.json"
 
+PREVIEW_PATH = "output/preview.pdf"
+
+# the HTML preview needs no lualatex, and can follow typing closely
+HTML_PREVIEW_DELAY_MS = 150
+
 
 @dataclasses.dataclass
 class Config:
@@ -101,6 +115,11 @@ class Config:
     default_output_dir: str = ""
     open_pdf_when_done: bool = True
 
+    # live preview
+    live_preview: bool = False
+    live_preview_delay_ms: int = 1500
+    html_preview: bool = False
+
     @classmethod
     def from_json(cls, filepath: str) -> "Config":
         with open(filepath, encoding="utf-8") as f:
@@ -118,6 +137,40 @@ class MainWindow(QMainWindow):
         # last saved text (for detecting modification)
         self._saved_text = ""
 
+        # re-parses only the parts of the editor text changed between actions
+        self._parser = txtparse.IncrementalParser()
+
+        # pdfs of documents compiled before
+        self._pdf_cache = compiler.PdfCache()
+        # .aux and .out files of the last compile, with which the next one
+        # mostly needs only one pass (see compiler.CompileJob)
+        self._aux_seed = {}
+        # records of compiles (see texlog), kept across runs; and the last
+        # record of each cv compiled in this session, to compare layouts with
+        self._compile_log = texlog.LogStore()
+        self._last_records = {}
+        # page counts measured in fitting cvs to pages; see fit_to_pages
+        self._page_counter = None
+        self._fit_thread = None
+
+        # fonts lualatex can load, for the font pickers and for validating
+        # settings; refreshed in the background at startup
+        self._font_index = None
+        self._font_thread = None
+        self._warm_up_thread = None
+
+        # live preview: compile once typing pauses, dropping stale compiles
+        self._preview_timer = QTimer(self)
+        self._preview_timer.setSingleShot(True)
+        self._preview_timer.timeout.connect(self.run_preview)
+        self._preview_process = None
+        self._preview_opened = False
+
+        # HTML preview, shown beside the editor
+        self._html_timer = QTimer(self)
+        self._html_timer.setSingleShot(True)
+        self._html_timer.timeout.connect(self.update_html_preview)
+
         # chat completion parameters
         self._chat_params = chat.Params()
         self._params_window = ParamsDialog()
@@ -169,6 +222,15 @@ class MainWindow(QMainWindow):
         self.console.setReadOnly(True)
         editor_panel.addWidget(self.console)
 
+        # HTML preview
+        self.html_view = QTextBrowser(self)
+        self.html_view.setObjectName("html_view")
+        self.html_view.setFrameShape(QFrame.Shape.NoFrame)
+        self.html_view.setOpenExternalLinks(True)
+        central_widget.addWidget(self.html_view)
+        # not to be dragged shut, which would leave it showing nothing when on
+        central_widget.setCollapsible(central_widget.indexOf(self.html_view), False)
+
         # Right panel
         control_panel = QFrame(self)
         central_widget.addWidget(control_panel)
@@ -180,6 +242,7 @@ class MainWindow(QMainWindow):
         control_panel_layout.addWidget(settings_area)
 
         self.settings_frame = LatexSettingsFrame(self)
+        self.settings_frame.changed.connect(self._on_settings_change)
         settings_area.setWidget(self.settings_frame)
         settings_area.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAsNeeded)
         settings_area.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAsNeeded)
@@ -239,6 +302,19 @@ class MainWindow(QMainWindow):
         self._a_parse.setToolTip("Show the parse tree in the console")
         self._a_runlatex = self._create_action("&Run", "Ctrl+r")
         self._a_runlatex.triggered.connect(self.run_latex)
+        self._a_togglepreview = self._create_action("&Live Preview", "Ctrl+Shift+l")
+        self._a_togglepreview.triggered.connect(self.toggle_live_preview)
+        self._a_togglepreview.setCheckable(True)
+        self._a_togglepreview.setToolTip(
+            f"Compile {PREVIEW_PATH} whenever typing pauses"
+        )
+        self._a_togglehtml = self._create_action("&HTML Preview", "Ctrl+Shift+h")
+        self._a_togglehtml.triggered.connect(self.toggle_html_preview)
+        self._a_togglehtml.setCheckable(True)
+        self._a_togglehtml.setToolTip("Show a quick HTML rendition of the cv")
+        self._a_fitpages = self._create_action("&Fit to Pages...", "Ctrl+Shift+f")
+        self._a_fitpages.triggered.connect(self.fit_to_pages)
+        self._a_fitpages.setToolTip("Tighten the spacing until the cv fits")
         self._a_impsettings = self._create_action("&Import Settings...", "Ctrl+i")
         self._a_impsettings.triggered.connect(self.import_settings)
         self._a_impsettings.setToolTip("Load LaTeX settings from a file")
@@ -286,11 +362,15 @@ class MainWindow(QMainWindow):
             self._config.window_width,
             self._config.window_height,
         )
-        central_widget.setSizes([680, 320])
+        # kept for the HTML preview while it is hidden, and given to it when
+        # it is shown
+        central_widget.setSizes([680, 400, 320])
         editor_panel.setSizes([450, 150])
 
         self.new_blank_file()
+        self._load_font_index()
         self._load_initial_settings()
+        self._warm_up_fonts()
 
     def _get_config(self):
         try:
@@ -359,6 +439,9 @@ class MainWindow(QMainWindow):
 
         latex_menu.addAction(self._a_parse)
         latex_menu.addAction(self._a_runlatex)
+        latex_menu.addAction(self._a_togglepreview)
+        latex_menu.addAction(self._a_togglehtml)
+        latex_menu.addAction(self._a_fitpages)
         latex_menu.addSeparator()
         latex_menu.addAction(self._a_impsettings)
         latex_menu.addAction(self._a_expsettings)
@@ -555,6 +638,9 @@ class MainWindow(QMainWindow):
         # menu items
         self._a_togglewrap.setChecked(self._config.editor_wrap_lines)
         self._a_toggleopenpdf.setChecked(self._config.open_pdf_when_done)
+        self._a_togglepreview.setChecked(self._config.live_preview)
+        self._a_togglehtml.setChecked(self._config.html_preview)
+        self.html_view.setVisible(self._config.html_preview)
 
         # syntax highlighting
         # TODO make configurable
@@ -589,6 +675,42 @@ class MainWindow(QMainWindow):
             bold=self._config.cv_unknown_bold,
         )
 
+    def _load_font_index(self):
+        # use the index of the last run, if any, until it is refreshed
+        try:
+            self._set_font_index(fonts.FontIndex.load())
+        except (FileNotFoundError, ValueError):
+            pass
+        self._font_thread = FontIndexThread(previous=self._font_index, parent=self)
+        self._font_thread.completed.connect(self._set_font_index)
+        self._font_thread.error.connect(
+            lambda e: self._console_log(f"Failed to index fonts: {e}")
+        )
+        self._font_thread.start()
+
+    def _warm_up_fonts(self):
+        # so that the first compile does not spend minutes, looking hung,
+        # updating luaotfload's databases
+        settings = self.settings_frame.get_settings()
+        families = [settings.main_font, settings.heading_font, settings.title_font]
+        self._warm_up_thread = FontWarmUpThread(families=families, parent=self)
+        self._warm_up_thread.progress.connect(self._console_log)
+        self._warm_up_thread.error.connect(
+            lambda e: self._console_log(f"Failed to prepare fonts: {e}")
+        )
+        self._warm_up_thread.start()
+
+    def _set_font_index(self, index: fonts.FontIndex):
+        self._font_index = index
+        self.settings_frame.set_font_families(index.families)
+
+    def _warn_settings(self, settings: tex.Settings):
+        # only a warning, as the font index may miss fonts lualatex can find;
+        # an empty index means fonts could not be looked for, not that there
+        # are none
+        for problem in settings.validate(self._font_index or None):
+            self._console_log(f"Warning: {problem}")
+
     def _load_initial_settings(self):
         try:
             settings = tex.Settings.from_json(LAST_USED_SETTINGS)
@@ -614,7 +736,8 @@ class MainWindow(QMainWindow):
             settings = self.settings_frame.get_settings()
             if not os.path.isdir(SETTINGS_DIR):
                 os.mkdir(SETTINGS_DIR)
-            json_dump(settings, filepath=LAST_USED_SETTINGS)
+            # canonical, e.g. 1.0 rather than 0.9999999999999999
+            json_dump(settings.frozen(), filepath=LAST_USED_SETTINGS)
 
             # Save current config; with update window geometry too
             window_rect = self.geometry()
@@ -626,13 +749,17 @@ class MainWindow(QMainWindow):
                 os.mkdir(CONFIG_DIR)
             json_dump(self._config, filepath=LAST_USED_CONFIG)
 
+            # Stop any live preview compile
+            self._preview_timer.stop()
+            self._kill_preview()
+
             # Close the prompt window if open
             self._prompt_window.close()
             event.accept()
 
     def show_parse_tree(self):
         try:
-            cv, unparsed = txtparse.parse(self.editor.toPlainText())
+            cv, unparsed = self._parser.parse(self.editor.toPlainText())
             self.console.setPlainText(cv.to_json())
         except Exception as e:
             self._handle_exc(e)
@@ -645,27 +772,119 @@ class MainWindow(QMainWindow):
         self.run_button.setDisabled(True)
         self._a_runlatex.setDisabled(True)
         # self.console.clear()
+        job = None
         try:
             template_path = "templates/classic.tex"
-            tex_path = "output/output.tex"
+            cv, _ = self._parser.parse(self.editor.toPlainText())
+            settings = self.settings_frame.get_settings()
 
-            if not os.path.isdir("output"):
-                os.mkdir("output")
+            # catch what would fail only after a full compile
+            self._warn_settings(settings)
 
-            cv, _ = txtparse.parse(self.editor.toPlainText())
-            settings = self.settings_frame.get_settings()
-            rendered = tex.render(template_path=template_path, cv=cv, settings=settings)
-            with open(tex_path, "w", encoding="utf-8") as tex_file:
-                tex_file.write(rendered)
+            # every run compiles in a scratch directory of its own
+            job = compiler.CompileJob(cv.name or "output")
+            job.seed(self._aux_seed)
+            with open(job.tex_path, "w", encoding="utf-8") as tex_file:
+                tex.render_to(
+                    tex_file, template_path=template_path, cv=cv, settings=settings
+                )
+
+            # an unchanged document need not be compiled again
+            cache_key = self._pdf_cache.key(job.tex_path, template_path=template_path)
+            if cached_path := self._pdf_cache.get(cache_key):
+                job.cleanup()
+                self._handle_cached_pdf(cached_path)
+                return
 
             process = QProcess(self)
+            process.setWorkingDirectory(job.dir)
             process.readyReadStandardOutput.connect(self._handle_latex_output)
-            process.finished.connect(self._handle_latex_finish)
+            process.finished.connect(
+                lambda exit_code, exit_status: self._handle_latex_finish(
+                    process, job, cache_key, exit_code, exit_status
+                )
+            )
+            process.errorOccurred.connect(
+                lambda error: self._handle_latex_error(process, job, error)
+            )
             process.setProcessChannelMode(QProcess.ProcessChannelMode.SeparateChannels)
-            process.start("lualatex", ["-interaction=nonstopmode", tex_path])
+            job.begin_pass()
+            process.start("lualatex", job.args())
+
+        except Exception as e:
+            # nothing was started that would clean up and re-enable the UI
+            if job:
+                job.cleanup()
+            self.run_button.setDisabled(False)
+            self._a_runlatex.setDisabled(False)
+            self._handle_exc(e)
 
+    def fit_to_pages(self):
+        if self._fit_thread is not None:
+            return
+        pages, ok = QInputDialog.getInt(
+            self, APP_TITLE, "Fit the cv to this many pages:", 1, 1, 10
+        )
+        if not ok:
+            return
+        try:
+            template_path = "templates/classic.tex"
+            cv, _ = self._parser.parse(self.editor.toPlainText())
+            settings = self.settings_frame.get_settings()
+            self._warn_settings(settings)
         except Exception as e:
             self._handle_exc(e)
+            return
+
+        # the counts measured so far hold as long as the template does
+        if (
+            self._page_counter is None
+            or self._page_counter.template_path != template_path
+        ):
+            self._page_counter = fitting.PageCounter(template_path)
+
+        self._a_fitpages.setDisabled(True)
+        self._console_log(f"Fitting the cv to {pages} page(s)...")
+        thread = FitThread(
+            cv=cv, settings=settings, pages=pages, counter=self._page_counter
+        )
+        self._fit_thread = thread
+        thread.progress.connect(self._console_log)
+        thread.completed.connect(
+            lambda fitted, count: self._handle_fit_finish(
+                settings, fitted, count, pages
+            )
+        )
+        thread.error.connect(self._handle_exc)
+
+        def _on_finished():
+            self._fit_thread = None
+            self._a_fitpages.setDisabled(False)
+
+        thread.finished.connect(_on_finished)
+        thread.start()
+
+    def _handle_fit_finish(
+        self, original: tex.Settings, fitted: tex.Settings, count: int, pages: int
+    ):
+        changes = [
+            f"{name}: {getattr(original, name)} -> {getattr(fitted, name)}"
+            for name in fitting.SPACING_LIMITS
+            if getattr(original, name) != getattr(fitted, name)
+        ]
+        for change in changes:
+            self._console_log(change)
+        compiles = self._page_counter.compiles
+        self._console_log(f"{compiles} draft compile(s) so far in this session")
+        self.settings_frame.load_settings(fitted)
+        if count > pages:
+            show_info(
+                parent=self,
+                text=f"Even with the tightest spacing, the cv takes {count} pages.",
+            )
+            return
+        self.console.xappend(f"The cv fits on {count} page(s).", weight=700)
+        self.console.xappend("")
 
     def _handle_latex_output(self):
         process = self.sender()
@@ -673,42 +892,254 @@ class MainWindow(QMainWindow):
         self.console.insertPlainText(output)
         self.console.ensureCursorVisible()
 
-    def _handle_latex_finish(self, exit_code, exit_status):
+    def _handle_latex_finish(
+        self,
+        process: QProcess,
+        job: compiler.CompileJob,
+        cache_key: str,
+        exit_code,
+        exit_status,
+    ):
+        job.end_pass()
+        failed = exit_code != 0 or exit_status != QProcess.ExitStatus.NormalExit
+
+        # another pass if cross-references or the outline changed
+        if not failed and job.needs_rerun():
+            self._console_log(f"Rerunning lualatex (pass {job.passes + 1})...")
+            job.begin_pass()
+            process.start("lualatex", job.args())
+            return
+        process.deleteLater()
+
         # re-enable UI
         self.run_button.setDisabled(False)
         self._a_runlatex.setDisabled(False)
-        # clean up
-        silent_remove("output.aux")
-        silent_remove("output.log")
-        silent_remove("output.out")
-        silent_remove("output.synctex(busy)")
-        silent_remove("output.synctex.gz")
+
+        # collect the pdf, and the log in case of errors; then clean up
+        if not failed:
+            self._aux_seed = job.snapshot()
+        # TODO may allow user to specify default output dir
+        try:
+            record = job.analyze(exit_code)
+            result = job.collect(
+                "output",
+                returncode=exit_code,
+                name=f"output_{timestamp()}",
+                keep_log=failed,
+                record=record,
+            )
+        except Exception as e:
+            self._handle_exc(e)
+            return
+        finally:
+            job.cleanup()
+
+        try:
+            self._compile_log.add(record)
+        except OSError as e:
+            self._console_log(f"Failed to record the compile: {e}")
 
         # handle errors if any
-        if exit_code != 0 or exit_status != QProcess.ExitStatus.NormalExit:
-            message = f"{exit_code=}, {exit_status=}"
+        if failed or not result.ok:
+            message = f"{exit_code=}, {exit_status=}, passes={job.passes}"
+            if record.error:
+                message = f"{record.error.describe()}\n\n{message}"
+            if result.log_path:
+                message = f"{message}\n\nSee {result.log_path} for details."
             show_error(parent=self, text=f"Sorry, something went wrong.\n\n{message}")
             return
 
+        try:
+            self._pdf_cache.put(cache_key, result.pdf_path)
+        except OSError as e:
+            self._console_log(f"Failed to cache the pdf: {e}")
+        self._console_log(record.summary())
+        for box in record.overfull:
+            self._console_log(box.describe())
+        if previous := self._last_records.get(record.document):
+            for change in texlog.layout_changes(previous, record):
+                self._console_log(change)
+        self._last_records[record.document] = record
+        self._console_log(f"PDF cache: {self._pdf_cache.stats()}")
+        self._handle_pdf_done(result.pdf_path)
+
+    def _handle_latex_error(
+        self, process: QProcess, job: compiler.CompileJob, error: QProcess.ProcessError
+    ):
+        # a process that fails to start never finishes; other errors are
+        # followed by `finished`
+        if error != QProcess.ProcessError.FailedToStart:
+            return
+        process.deleteLater()
+        job.cleanup()
+        self.run_button.setDisabled(False)
+        self._a_runlatex.setDisabled(False)
+        show_error(
+            parent=self, text=f"Failed to start lualatex.\n\n{process.errorString()}"
+        )
+
+    def _handle_cached_pdf(self, cached_path: str):
+        # re-enable UI
+        self.run_button.setDisabled(False)
+        self._a_runlatex.setDisabled(False)
+
+        self._console_log("Document unchanged; reusing the pdf compiled before.")
+        self._console_log(f"PDF cache: {self._pdf_cache.stats()}")
+        try:
+            os.makedirs("output", exist_ok=True)
+            dest_path = os.path.join("output", f"output_{timestamp()}.pdf")
+            shutil.copyfile(cached_path, dest_path)
+        except Exception as e:
+            self._handle_exc(e)
+            return
+        self._handle_pdf_done(dest_path)
+
+    def _handle_pdf_done(self, pdf_path: str):
         self.console.xappend("Operation completed successfully.", weight=700)
         self.console.xappend("")
 
-        basename = f"output_{timestamp()}.pdf"
-        # TODO may allow user to specify default output dir
-        dest_path = os.path.join("output", basename)
         try:
-            if not os.path.isdir("output"):
-                os.mkdir("output")
-            if os.path.isfile(dest_path):
-                os.remove(dest_path)
-            os.rename("output.pdf", dest_path)
             if self._config.open_pdf_when_done:
-                os.startfile(dest_path)
+                os.startfile(pdf_path)
         except Exception as e:
             self._handle_exc(e)
 
+    def _schedule_preview(self):
+        # a newer edit makes the compile in flight stale; restarting the
+        # timer lets typing settle before the next one starts
+        self._kill_preview()
+        self._preview_timer.start(self._config.live_preview_delay_ms)
+
+    def _kill_preview(self):
+        if self._preview_process is not None:
+            self._preview_process.kill()
+            self._preview_process = None
+
+    def run_preview(self):
+        self._kill_preview()
+        job = None
+        try:
+            template_path = "templates/classic.tex"
+            cv, _ = self._parser.parse(self.editor.toPlainText())
+            settings = self.settings_frame.get_settings()
+            self._warn_settings(settings)
+
+            job = compiler.CompileJob("preview", document=cv.name or "output")
+            job.seed(self._aux_seed)
+            with open(job.tex_path, "w", encoding="utf-8") as tex_file:
+                tex.render_to(
+                    tex_file, template_path=template_path, cv=cv, settings=settings
+                )
+            cache_key = self._pdf_cache.key(job.tex_path, template_path=template_path)
+            if cached_path := self._pdf_cache.get(cache_key):
+                job.cleanup()
+                os.makedirs(os.path.dirname(PREVIEW_PATH), exist_ok=True)
+                shutil.copyfile(cached_path, PREVIEW_PATH)
+                self._show_preview()
+                return
+        except Exception as e:
+            if job:
+                job.cleanup()
+            # no dialogs here, which would interrupt typing
+            self._console_log(f"Live preview failed: {e}")
+            return
+
+        # lualatex's output is of no interest and must not fill up a pipe
+        process = QProcess(self)
+        process.setWorkingDirectory(job.dir)
+        process.setStandardOutputFile(QProcess.nullDevice())
+        process.setStandardErrorFile(QProcess.nullDevice())
+        process.finished.connect(
+            lambda exit_code, exit_status: self._handle_preview_finish(
+                process, job, cache_key, exit_code, exit_status
+            )
+        )
+        process.errorOccurred.connect(
+            lambda error: self._handle_preview_error(process, job, error)
+        )
+        self._preview_process = process
+        job.begin_pass()
+        process.start("lualatex", job.args())
+
+    def _handle_preview_error(
+        self, process: QProcess, job: compiler.CompileJob, error: QProcess.ProcessError
+    ):
+        # a process that fails to start never finishes, and would block
+        # later previews
+        if error != QProcess.ProcessError.FailedToStart:
+            return
+        process.deleteLater()
+        job.cleanup()
+        if process is self._preview_process:
+            self._preview_process = None
+            self._console_log(
+                f"Live preview failed to start lualatex: {process.errorString()}"
+            )
+
+    def _handle_preview_finish(
+        self,
+        process: QProcess,
+        job: compiler.CompileJob,
+        cache_key: str,
+        exit_code,
+        exit_status,
+    ):
+        # killed for being stale
+        if process is not self._preview_process:
+            process.deleteLater()
+            job.cleanup()
+            return
+
+        job.end_pass()
+        failed = exit_code != 0 or exit_status != QProcess.ExitStatus.NormalExit
+        if not failed and job.needs_rerun():
+            job.begin_pass()
+            process.start("lualatex", job.args())
+            return
+        process.deleteLater()
+        self._preview_process = None
+        if not failed:
+            self._aux_seed = job.snapshot()
+        preview_dir, preview_name = os.path.split(PREVIEW_PATH)
+        try:
+            record = job.analyze(exit_code)
+            result = job.collect(
+                preview_dir,
+                returncode=exit_code,
+                name=os.path.splitext(preview_name)[0],
+                keep_log=failed,
+                record=record,
+            )
+            if result.ok:
+                self._pdf_cache.put(cache_key, result.pdf_path)
+        except OSError as e:
+            self._console_log(f"Live preview failed: {e}")
+            return
+        finally:
+            job.cleanup()
+
+        # recorded like any other compile, so that its timings count
+        try:
+            self._compile_log.add(record)
+        except OSError as e:
+            self._console_log(f"Failed to record the compile: {e}")
+
+        if result.ok:
+            self._show_preview()
+        else:
+            self._console_log(f"Live preview failed; see {result.log_path}")
+
+    def _show_preview(self):
+        # open the preview once; pdf viewers reload it as it changes
+        if self._config.open_pdf_when_done and not self._preview_opened:
+            self._preview_opened = True
+            try:
+                os.startfile(os.path.abspath(PREVIEW_PATH))
+            except Exception as e:
+                self._handle_exc(e)
+
     def create_casebook(self):
-        cv, _ = txtparse.parse(self.editor.toPlainText())
+        cv, _ = self._parser.parse(self.editor.toPlainText())
         basename = f"case_{timestamp()}.xlsx"
         dest_path = os.path.join("output", basename)
         thread = ExcelThread(cv=cv)
@@ -775,6 +1206,14 @@ class MainWindow(QMainWindow):
 
     def _on_editor_change(self):
         self.setWindowModified(self.editor.toPlainText() != self._saved_text)
+        if self._config.live_preview:
+            self._schedule_preview()
+        if self._config.html_preview:
+            self._html_timer.start(HTML_PREVIEW_DELAY_MS)
+
+    def _on_settings_change(self):
+        if self._config.html_preview:
+            self._html_timer.start(HTML_PREVIEW_DELAY_MS)
 
     def _console_log(self, text: str):
         self.console.xappend(text, color=self._config.console_log_foreground)
@@ -900,7 +1339,7 @@ class MainWindow(QMainWindow):
         if not filepath:
             return
         settings = self.settings_frame.get_settings()
-        json_dump(settings, filepath=filepath)
+        json_dump(settings.frozen(), filepath=filepath)
 
     def restore_default(self):
         self.settings_frame.load_settings(tex.Settings())
@@ -923,6 +1362,36 @@ class MainWindow(QMainWindow):
         self._config.open_pdf_when_done = state
         self._update_ui_with_config()
 
+    def toggle_html_preview(self, state: bool):
+        self._config.html_preview = state
+        self._update_ui_with_config()
+        if state:
+            self.update_html_preview()
+
+    def update_html_preview(self):
+        try:
+            cv, _ = self._parser.parse(self.editor.toPlainText())
+            settings = self.settings_frame.get_settings()
+            html_source = htmlpreview.render(cv=cv, settings=settings)
+        except Exception as e:
+            # no dialogs here, which would interrupt typing
+            self._console_log(f"HTML preview failed: {e}")
+            return
+        # stay where the user has scrolled to
+        scroll_bar = self.html_view.verticalScrollBar()
+        position = scroll_bar.value()
+        self.html_view.setHtml(html_source)
+        scroll_bar.setValue(position)
+
+    def toggle_live_preview(self, state: bool):
+        self._config.live_preview = state
+        self._update_ui_with_config()
+        if state:
+            self._schedule_preview()
+        else:
+            self._preview_timer.stop()
+            self._kill_preview()
+
     def open_config_dialog(self):
         w = ConfigDialog(self)
         w.setWindowTitle("Options")
@@ -1037,6 +1506,19 @@ class ConfigDialog(QDialog):
 
         layout.addSpacing(space_after_group)
 
+        layout.addWidget(QLabel("Live Preview"))
+        self.live_preview_check = QCheckBox("Compile when typing pauses", self)
+        layout.addWidget(self.live_preview_check)
+        layout.addSpacing(space_within_group)
+
+        self.live_preview_delay_selector = QSpinBox(
+            self, minimum=200, maximum=10000, singleStep=100, suffix=" ms"
+        )
+        self.live_preview_delay_selector.setPrefix("Pause: ")
+        layout.addWidget(self.live_preview_delay_selector)
+
+        layout.addSpacing(space_after_group)
+
         button_frame = QFrame(self)
         layout.addWidget(button_frame)
         button_frame_layout = QHBoxLayout()
@@ -1054,6 +1536,8 @@ class ConfigDialog(QDialog):
         c.console_font = self.console_font_selector.currentFont().family()
         c.console_font_size = self.console_font_size_selector.value()
         c.console_wrap_lines = self.console_wrap_check.isChecked()
+        c.live_preview = self.live_preview_check.isChecked()
+        c.live_preview_delay_ms = self.live_preview_delay_selector.value()
         return c
 
     def load_config(self, config: Config):
@@ -1063,6 +1547,8 @@ class ConfigDialog(QDialog):
         self.console_font_selector.setCurrentFont(QFont(config.console_font))
         self.console_font_size_selector.setValue(config.console_font_size)
         self.console_wrap_check.setChecked(config.console_wrap_lines)
+        self.live_preview_check.setChecked(config.live_preview)
+        self.live_preview_delay_selector.setValue(config.live_preview_delay_ms)
 
 
 class ParamsDialog(QDialog):
@@ -1287,6 +1773,9 @@ class ParamsDialog(QDialog):
 
 
 class LatexSettingsFrame(QFrame):
+    # emitted whenever any setting is changed
+    changed = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -1308,7 +1797,7 @@ class LatexSettingsFrame(QFrame):
 
         # text font
         layout.addWidget(QLabel("Text Font"))
-        self.text_font_selector = QFontComboBox(self)
+        self.text_font_selector = LatexFontSelector(self)
         layout.addWidget(self.text_font_selector)
         self.text_size_selector = QSpinBox(self, minimum=8, maximum=14, suffix=" pt")
         layout.addWidget(self.text_size_selector)
@@ -1316,7 +1805,7 @@ class LatexSettingsFrame(QFrame):
 
         # heading font
         layout.addWidget(QLabel("Heading Font"))
-        self.heading_font_selector = QFontComboBox(self)
+        self.heading_font_selector = LatexFontSelector(self)
         layout.addWidget(self.heading_font_selector)
         self.heading_size_selector = LatexFontSizeSelector(self)
         layout.addWidget(self.heading_size_selector)
@@ -1324,7 +1813,7 @@ class LatexSettingsFrame(QFrame):
 
         # title font
         layout.addWidget(QLabel("Title Font"))
-        self.title_font_selector = QFontComboBox(self)
+        self.title_font_selector = LatexFontSelector(self)
         layout.addWidget(self.title_font_selector)
         self.title_size_selector = LatexFontSizeSelector(self)
         layout.addWidget(self.title_size_selector)
@@ -1495,24 +1984,40 @@ class LatexSettingsFrame(QFrame):
 
         # handle event
         self.color_links_check.stateChanged.connect(self._update_urlcolor_selector)
+        for widget in self.findChildren(QCheckBox):
+            widget.toggled.connect(self.changed)
+        for widget in self.findChildren((QSpinBox, QDoubleSpinBox)):
+            widget.valueChanged.connect(self.changed)
+        for widget in self.findChildren(QComboBox):
+            widget.currentTextChanged.connect(self.changed)
+        for widget in self.findChildren(QLineEdit):
+            widget.textChanged.connect(self.changed)
 
     def _update_urlcolor_selector(self):
         selectable = self.color_links_check.isChecked()
         self.url_color_selector.setEnabled(selectable)
 
+    def set_font_families(self, families: list[str]):
+        for selector in [
+            self.text_font_selector,
+            self.heading_font_selector,
+            self.title_font_selector,
+        ]:
+            selector.set_families(families)
+
     def get_settings(self) -> tex.Settings:
         s = tex.Settings()
 
         s.show_activity_locations = self.activity_location_check.isChecked()
         s.show_time_commitments = self.time_commitment_check.isChecked()
 
-        s.main_font = self.text_font_selector.currentFont().family()
+        s.main_font = self.text_font_selector.get_family()
         s.font_size_in_point = self.text_size_selector.value()
 
-        s.heading_font = self.heading_font_selector.currentFont().family()
+        s.heading_font = self.heading_font_selector.get_family()
         s.heading_relative_size = self.heading_size_selector.get_command()
 
-        s.title_font = self.title_font_selector.currentFont().family()
+        s.title_font = self.title_font_selector.get_family()
         s.title_relative_size = self.title_size_selector.get_command()
 
         s.proportional_numbers = self.proportional_numbers_check.isChecked()
@@ -1563,13 +2068,13 @@ class LatexSettingsFrame(QFrame):
         self.activity_location_check.setChecked(s.show_activity_locations)
         self.time_commitment_check.setChecked(s.show_time_commitments)
 
-        self.text_font_selector.setCurrentFont(QFont(s.main_font))
+        self.text_font_selector.set_family(s.main_font)
         self.text_size_selector.setValue(s.font_size_in_point)
 
-        self.heading_font_selector.setCurrentFont(QFont(s.heading_font))
+        self.heading_font_selector.set_family(s.heading_font)
         self.heading_size_selector.set_from_command(s.heading_relative_size)
 
-        self.title_font_selector.setCurrentFont(QFont(s.title_font))
+        self.title_font_selector.set_family(s.title_font)
         self.title_size_selector.set_from_command(s.title_relative_size)
 
         self.proportional_numbers_check.setChecked(s.proportional_numbers)
@@ -1633,6 +2138,34 @@ class LatexPaperSelector(QComboBox):
         self.setCurrentText(self._paper_to_text[paper])
 
 
+class LatexFontSelector(QComboBox):
+    # Lists the fonts of the font index rather than every font Qt knows,
+    # which takes long to enumerate and includes fonts lualatex cannot load;
+    # a font not (yet) indexed can still be typed in
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.InsertPolicy.NoInsert)
+        self.completer().setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.completer().setFilterMode(Qt.MatchFlag.MatchContains)
+
+    def set_families(self, families: list[str]):
+        family = self.get_family()
+        self.clear()
+        self.addItems(families)
+        self.set_family(family)
+
+    def get_family(self) -> str:
+        return self.currentText().strip()
+
+    def set_family(self, family: str):
+        index = self.findText(family, Qt.MatchFlag.MatchFixedString)
+        if index >= 0:
+            self.setCurrentIndex(index)
+        else:
+            self.setEditText(family)
+
+
 class LatexFontSizeSelector(QSpinBox):
     _commands = [
         "normalsize",
@@ -1717,16 +2250,7 @@ class LatexColorSelector(QComboBox):
 class DateFormatSelector(QComboBox):
     _sample_date = txtparse.SmartDate(year=2022, month=11, day=1)
     _sample_to_style = {}
-    for _style in [
-        "american",
-        "american long",
-        "american slash",
-        "british",
-        "british long",
-        "british slash",
-        "iso",
-        "yyyy/mm/dd",
-    ]:
+    for _style in tex.DATE_STYLES:
         _key = tex.format_date(_sample_date, style=_style)
         _sample_to_style[_key] = _style
 
@@ -1856,6 +2380,76 @@ class ChatWaitThread(QThread):
             waittime += interval
 
 
+class FitThread(QThread):
+    progress = pyqtSignal(str)
+    completed = pyqtSignal(tex.Settings, int)
+    error = pyqtSignal(Exception)
+
+    def __init__(
+        self,
+        cv: txtparse.CV,
+        settings: tex.Settings,
+        pages: int,
+        counter: fitting.PageCounter,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.cv = cv
+        self.settings = settings
+        self.pages = pages
+        self.counter = counter
+
+    def run(self):
+        try:
+            fitted, count = fitting.fit_to_pages(
+                self.cv,
+                self.settings,
+                pages=self.pages,
+                counter=self.counter,
+                progress=self.progress.emit,
+            )
+        except Exception as e:
+            self.error.emit(e)
+        else:
+            self.completed.emit(fitted, count)
+
+
+class FontIndexThread(QThread):
+    completed = pyqtSignal(fonts.FontIndex)
+    error = pyqtSignal(Exception)
+
+    def __init__(self, previous: fonts.FontIndex | None = None, parent=None):
+        super().__init__(parent)
+        self.previous = previous
+
+    def run(self):
+        try:
+            index = fonts.build_index(previous=self.previous)
+            index.save()
+        except Exception as e:
+            self.error.emit(e)
+        else:
+            self.completed.emit(index)
+
+
+class FontWarmUpThread(QThread):
+    progress = pyqtSignal(str)
+    completed = pyqtSignal(list)
+    error = pyqtSignal(Exception)
+
+    def __init__(self, families: list[str], parent=None):
+        super().__init__(parent)
+        self.families = families
+
+    def run(self):
+        try:
+            missing = fonts.warm_up(self.families, progress=self.progress.emit)
+        except Exception as e:
+            self.error.emit(e)
+        else:
+            self.completed.emit(missing)
+
+
 class ExcelThread(QThread):
     progress = pyqtSignal(str)
     completed = pyqtSignal(excel.Workbook)
@@ -1863,10 +2457,12 @@ class ExcelThread(QThread):
 
     def __init__(self, cv: txtparse.CV, parent=None):
         super().__init__(parent)
-        self.cv = cv
+        # translations are written into the cv; copy it so as not to alter
+        # entries cached by the parser
+        self.cv = copy.deepcopy(cv)
 
         self._activity_translators = []
-        for i, act in enumerate(cv.activities):
+        for i, act in enumerate(self.cv.activities):
             role_translator = Translator(act.role, id=("role", i))
             self._activity_translators.append(role_translator)
             org_translator = Translator(act.org, id=("org", i))
@@ -1880,7 +2476,7 @@ class ExcelThread(QThread):
             thread.error.connect(self.error.emit)
 
         self._award_translators = []
-        for i, award in enumerate(cv.awards):
+        for i, award in enumerate(self.cv.awards):
             award_translator = Translator(award.name, id=i)
             award_translator.result_ready.connect(self._handle_award_result)
             award_translator.error.connect(self.error.emit)
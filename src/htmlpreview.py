@@ -0,0 +1,106 @@
+import functools
+import html
+import os
+
+import jinja2
+
+import tex
+from tex import Settings
+from txtparse import CV, SmartDate
+
+# A quick stand-in for the pdf, made without lualatex: an HTML version of
+# the LaTeX template, rendered with the same template syntax
+TEMPLATE_PATH = "templates/classic.html"
+
+ENVIRONMENT = jinja2.Environment(
+    loader=tex.ENVIRONMENT.loader,
+    bytecode_cache=tex.ENVIRONMENT.bytecode_cache,
+    auto_reload=True,
+    block_start_string="<!",
+    block_end_string="!>",
+    variable_start_string="<<",
+    variable_end_string=">>",
+    comment_start_string="<#",
+    comment_end_string="#>",
+    trim_blocks=False,
+    lstrip_blocks=True,
+    keep_trailing_newline=True,
+)
+
+
+def render(*, template_path: str = TEMPLATE_PATH, cv: CV, settings: Settings):
+    template = ENVIRONMENT.get_template(os.path.abspath(template_path))
+    return template.render(cv=cv, settings=settings)
+
+
+@functools.lru_cache(maxsize=4096)
+def to_html(s: str):
+    # The counterpart of tex.to_latex, with the same markdown syntax for
+    # italic, bold and urls
+    return _to_html(s, 0, len(s))
+
+
+def _to_html(s: str, start: int, end: int) -> str:
+    # tokenized as by tex._to_latex
+    chunks = []
+    for mo in tex.LATEX_TOKEN.finditer(s, start, end):
+        chunks.append(_plain_text(s[start : mo.start()]))
+        start = mo.end()
+        kind = mo.lastgroup
+        if kind == "escaped_asterisk":
+            chunks.append("*")
+        elif kind == "quote":
+            # only opening quotes, at the start or after a space, change
+            if mo.start() and not s[mo.start() - 1].isspace():
+                chunks.append(html.escape(mo.group(kind)))
+            elif mo.group(kind) == '"':
+                chunks.append("\u201c")
+            else:
+                chunks.append("\u2018")
+        elif kind == "url":
+            text = _to_html(s, *mo.span("link_text"))
+            url = html.escape(s[slice(*mo.span("url"))])
+            chunks.append(f'<a href="{url}">{text}</a>')
+        elif kind in {"bold_italic", "bold", "italic"}:
+            inner = _to_html(s, *mo.span(kind))
+            if kind == "bold_italic":
+                chunks.append(f"<em><b>{inner}</b></em>")
+            elif kind == "bold":
+                chunks.append(f"<b>{inner}</b>")
+            else:
+                chunks.append(f"<em>{inner}</em>")
+        else:
+            # characters special to LaTeX only
+            chunks.append(html.escape(mo.group()))
+    chunks.append(_plain_text(s[start:end]))
+    return "".join(chunks)
+
+
+def _plain_text(s: str) -> str:
+    # with the dashes of TeX's ligatures
+    return html.escape(s).replace("---", "\u2014").replace("--", "\u2013")
+
+
+ENVIRONMENT.filters["to_html"] = to_html
+ENVIRONMENT.filters["null_or_prefixed"] = tex.null_or_prefixed
+
+
+def format_date(
+    date1: SmartDate | None, style: str, date2: SmartDate | None = None
+) -> str:
+    # the dashes of tex.format_date as lualatex sets them: en dashes, between
+    # thin spaces if between dates
+    s = tex.format_date(date1, style, date2)
+    s = s.replace(tex.DATE_DASH, "\u2009\u2013\u2009").replace(tex.DAY_DASH, "\u2013")
+    return html.escape(s)
+
+
+ENVIRONMENT.filters["format_date"] = format_date
+
+
+def format_commitment(hours_per_week: str, weeks_per_year: str):
+    return html.escape(tex.format_commitment(hours_per_week, weeks_per_year))
+
+
+ENVIRONMENT.filters["format_commitment"] = format_commitment
+ENVIRONMENT.filters["handle_ending_period"] = tex.handle_ending_period
@@ -1,11 +1,26 @@
+import io
 import os
+import sys
+import copy
+import pickle
+import dataclasses
+import struct
 import subprocess
+import tempfile
+from unittest import mock
 
 import txtparse
+import compiler
+import corpus
+import cvpack
+import fitting
 import docparse
+import fonts
+import htmlpreview
+import tex
+import texlog
 from tex import Settings, render
 
-
 TXT_PATH = "tests/sample1.txt"
 DOC_PATH = "tests/sample2.docx"
 TEX_PATH = "output.tex"
@@ -14,13 +29,766 @@ TEMPLATE_PATH = "templates/classic.tex"
 
 def test_txt_parse():
     with open(TXT_PATH, encoding="utf-8") as f:
-        cv, unparsed = txtparse.parse(f.read())
+        src = f.read()
+    cv, unparsed = txtparse.parse(src)
     _print_parsed(cv, unparsed)
+    _check_sample(cv)
+    assert unparsed == []
+    assert cv.activities[2].descriptions[0].startswith("Designed and implemented")
+
+    # lines that match no keyword, or a keyword no entry has, are returned
+    _, unparsed = txtparse.parse(f"no keyword\n{src}\nfoo: bar\n")
+    assert unparsed == ["no keyword", "foo: bar"]
+
+    # so are fields of another kind of entry than the one they follow
+    misplaced = "role: Engineer\nGPA: 4.0\naward: Prize\nScore: 100\naward date: 2020\n"
+    for cv, unparsed in [
+        txtparse.parse(misplaced),
+        txtparse.IncrementalParser().parse(misplaced),
+    ]:
+        assert unparsed == ["GPA: 4.0", "Score: 100"]
+        assert not hasattr(cv.activities[0], "gpa")
+        assert not hasattr(cv.awards[0], "score")
+        assert cv.awards[0].date.year == 2020
+
+
+def test_txt_parse_iter():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        cv, unparsed = txtparse.parse(f.read())
+    streamed_cv, streamed_unparsed = txtparse.CV(), []
+    with open(TXT_PATH, encoding="utf-8") as f:
+        entries = list(
+            txtparse.parse_iter(f, cv=streamed_cv, unparsed=streamed_unparsed)
+        )
+    streamed = {}
+    for entry in entries:
+        streamed.setdefault(type(entry), []).append(dataclasses.asdict(entry))
+    assert streamed[txtparse.Education] == list(map(dataclasses.asdict, cv.education))
+    assert streamed[txtparse.Activity] == list(map(dataclasses.asdict, cv.activities))
+    assert streamed_cv.name == cv.name
+    assert streamed_unparsed == unparsed
+
+
+def test_parse_many():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        src = f.read()
+    cv, unparsed = txtparse.parse(src)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        container_path = os.path.join(tmpdir, "cohort.txt")
+        with open(container_path, "w", encoding="utf-8") as f:
+            f.write("\n===\n".join([src] * 5))
+            f.write("\n===\n")
+        results = txtparse.parse_many(container_path, max_workers=2)
+    assert len(results) == 5
+    for result_cv, result_unparsed in results:
+        assert result_cv.to_json() == cv.to_json()
+        assert result_unparsed == unparsed
+
+    # a bad record fails alone
+    with tempfile.TemporaryDirectory() as tmpdir:
+        container_path = os.path.join(tmpdir, "cohort.txt")
+        with open(container_path, "wb") as f:
+            f.write(b"\n===\n".join([src.encode(), b"\xff\xfe", src.encode()]))
+        results = txtparse.parse_many(container_path, max_workers=2)
+    assert isinstance(results[1], txtparse.ParsingError)
+    assert results[0][0].to_json() == results[2][0].to_json() == cv.to_json()
+
+
+def test_incremental_parse():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        src = f.read()
+    parser = txtparse.IncrementalParser()
+    for edited in [
+        src,
+        src.replace("Amsterdam Day Care", "Amsterdam Kindergarten"),
+        src.replace("# Projects", "# Side Projects"),
+        src.replace("role: Creator", "org: Spam\nrole: Creator"),
+    ]:
+        cv, unparsed = parser.parse(edited)
+        expected_cv, expected_unparsed = txtparse.parse(edited)
+        assert cv.to_json() == expected_cv.to_json()
+        assert unparsed == expected_unparsed
+
+
+# upper bounds of the size in bytes of each (slotted) record, measured with
+# sys.getsizeof on 64-bit CPython 3.10/3.11; strings and lists not included
+MEMORY_BUDGET = {
+    txtparse.CV: 120,
+    txtparse.Education: 112,
+    txtparse.Activity: 104,
+    txtparse.Award: 48,
+    txtparse.Test: 56,
+    txtparse.SkillSet: 48,
+    txtparse.SmartDate: 72,
+}
+
+
+def test_memory_budget():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        cv, _ = txtparse.parse(f.read())
+    records = [cv, *cv.education, *cv.activities, *cv.awards, *cv.tests]
+    records.extend([*cv.skillsets, *(a.start_date for a in cv.activities)])
+    for record in records:
+        assert not hasattr(record, "__dict__")
+        assert sys.getsizeof(record) <= MEMORY_BUDGET[type(record)]
+    # a repeated string is parsed once, and equal dates share one instance
+    from_str = txtparse.SmartDate.from_str
+    date = from_str("2023-06")
+    hits = from_str.cache_info().hits
+    assert from_str("2023-06") is date
+    assert from_str.cache_info().hits == hits + 1
+    assert from_str("2023/06") is date
+    # but no more than MAX_INTERNED_DATES of them
+    for i in range(txtparse.MAX_INTERNED_DATES + 10):
+        txtparse.SmartDate.from_str(f"fallback {i}")
+    assert len(txtparse._interned_dates) == txtparse.MAX_INTERNED_DATES
+
+
+def test_date_order():
+    def old_key(d):
+        # the comparison SmartDate made before it had a sort_key
+        return (d.year or float("inf"), d.month or -1, d.day or -1, d.fallback.lower())
+
+    SmartDate = txtparse.SmartDate
+    dates = [SmartDate(fallback=s) for s in ["", "Present", "present", "Summer"]]
+    for year in [1999, 2023]:
+        dates.append(SmartDate(year))
+        for month in [1, 12]:
+            dates.append(SmartDate(year, month))
+            dates.extend(SmartDate(year, month, day) for day in [1, 28])
+    for a in dates:
+        for b in dates:
+            assert (a < b) == (old_key(a) < old_key(b)), (a, b)
+            assert (a == b) == (old_key(a) == old_key(b) and a.fallback == b.fallback)
+            if a.sort_key < b.sort_key:
+                assert old_key(a) < old_key(b), (a, b)
+
+
+def test_cv_indexes():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        cv, _ = txtparse.parse(f.read())
+    assert cv.last_education is sorted(cv.education)[-1]
+    for section in ["", *cv.activity_sections]:
+        expected = [a for a in cv.activities if a.section == section]
+        assert cv.activities_of_section(section) == expected
+    # the indexes follow changes to the lists
+    cv.tests.append(txtparse.Test(name="GRE"))
+    assert [t.name for t in cv.academic_tests()] == ["SAT", "GRE"]
+    cv.education.clear()
+    assert cv.last_education is None
+    cv.activities = [txtparse.Activity(role="Spam", section="Eggs")]
+    assert cv.activities_of_section("Eggs") == cv.activities
+
+
+def test_cv_indexes_copy():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        cv, _ = txtparse.parse(f.read())
+    cv.tests.append(txtparse.Test(name="GRE"))  # leaves the index stale
+    for copied in [pickle.loads(pickle.dumps(cv)), copy.deepcopy(cv)]:
+        assert copied.tests == cv.tests
+        assert [t.name for t in copied.academic_tests()] == ["SAT", "GRE"]
+        assert copied.last_education == cv.last_education
+        assert copied.activities_of_section("") == cv.activities_of_section("")
+
+
+def test_corpus_table():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        src = f.read()
+    cvs = [
+        txtparse.parse(src.replace("xxx (L/S/R/W)", f"{score} (L/S/R/W)"))[0]
+        for score in [100, 105, 110]
+    ]
+    table = corpus.CorpusTable(cvs)
+    tests = table.tests
+    good_toefl = (tests["name"] == "TOEFL") & (tests["score"] >= 105)
+    assert table.select(table.any_per_cv(tests, good_toefl)) == cvs[1:]
+    assert list(table.max_per_cv(tests, tests["score"])) == [100, 105, 110]
+    assert list(table.activities.offsets) == [0, 4, 8, 12]
+    assert str(table.education["start_date"][0]) == "1981-09-01"
+
+
+def test_template_cache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        template_path = os.path.join(tmpdir, "template.tex")
+        with open(template_path, "w", encoding="utf-8") as f:
+            f.write("<< cv.name >>")
+        cv = txtparse.CV(name="Jane")
+        assert render(template_path=template_path, cv=cv, settings=Settings()) == "Jane"
+        template = tex.ENVIRONMENT.get_template(os.path.abspath(template_path))
+        render(template_path=template_path, cv=cv, settings=Settings())
+        assert tex.ENVIRONMENT.get_template(template.filename) is template
+
+        # a modified template is compiled again
+        with open(template_path, "w", encoding="utf-8") as f:
+            f.write("<< cv.name | upper >>")
+        os.utime(template_path, (0, 0))
+        assert render(template_path=template_path, cv=cv, settings=Settings()) == "JANE"
+
+
+def test_render_to():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        cv, _ = txtparse.parse(f.read())
+    expected = render(template_path=TEMPLATE_PATH, cv=cv, settings=TEST_SETTINGS)
+    text_file, binary_file = io.StringIO(), io.BytesIO()
+    for file in [text_file, binary_file]:
+        tex.render_to(file, template_path=TEMPLATE_PATH, cv=cv, settings=TEST_SETTINGS)
+    assert text_file.getvalue() == expected
+    assert binary_file.getvalue().decode("utf-8") == expected
+
+
+def test_frozen_settings():
+    frozen = Settings(bottom_margin_in_inch=0.9999999999999999).frozen()
+    assert frozen == Settings(bottom_margin_in_inch=1).frozen()
+    assert len({frozen, Settings().frozen()}) == 1
+    assert frozen.fingerprint == Settings().frozen().fingerprint
+    assert frozen.thaw() == Settings()
+    # values are converted only if nothing is lost
+    converted = Settings(
+        bold_headings="False", color_links=1, entry_skip_in_pt=6.0, line_spread="1"
+    ).frozen()
+    assert converted.bold_headings is False and converted.color_links is True
+    assert converted.entry_skip_in_pt == 6 and type(converted.entry_skip_in_pt) is int
+    assert converted.line_spread == 1.0 and type(converted.line_spread) is float
+    # and otherwise kept as they are, to render as before, and reported
+    for lossy in [
+        {"entry_skip_in_pt": 6.5},
+        {"entry_skip_in_pt": "6.5"},
+        {"bold_headings": "no"},
+        {"bold_headings": 2},
+        {"line_spread": None},
+    ]:
+        settings = Settings(**lossy)
+        ((name, value),) = lossy.items()
+        assert getattr(settings.frozen(), name) == value
+        (problem,) = settings.validate()
+        assert name in problem
+    assert "6.5pt" in render(
+        template_path=TEMPLATE_PATH,
+        cv=txtparse.CV(),
+        settings=Settings(entry_skip_in_pt=6.5),
+    )
+    with_font = Settings(main_font="Crimson Pro").frozen()
+    assert with_font.preamble_digest == frozen.preamble_digest
+    assert with_font.body_digest != frozen.body_digest
+
+    # PREAMBLE_FIELDS are exactly the settings the preamble block uses
+    def preamble(settings):
+        return tex.render_preamble(template_path=TEMPLATE_PATH, settings=settings)
+
+    default = Settings()
+    for field in dataclasses.fields(Settings):
+        value = getattr(default, field.name)
+        if field.type is bool:
+            changed = not value
+        elif field.name == "paper":
+            changed = "letterpaper"
+        else:
+            changed = value + field.type(1)
+        settings = dataclasses.replace(default, **{field.name: changed})
+        assert (preamble(settings) != preamble(default)) == (
+            field.name in tex.PREAMBLE_FIELDS
+        ), field.name
+
+
+def test_render_many():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        cv, _ = txtparse.parse(f.read())
+    broken_cv = txtparse.CV(name=["not", "a", "string"])
+    settings = Settings()
+    results = dict(
+        tex.render_many(
+            {"a": cv, "b": broken_cv, "c": cv}, settings, TEMPLATE_PATH, workers=2
+        )
+    )
+    expected = render(template_path=TEMPLATE_PATH, cv=cv, settings=settings)
+    assert results["a"] == results["c"] == expected
+    assert isinstance(results["b"], tex.RenderError)
+
+
+def test_to_latex():
+    cases = {
+        "100% & $5 #1 a_b ^ ~": r"100\% \& \$5 \#1 a\_b \^{} \textasciitilde{}",
+        """say "hi" and 'yo'""": "say ``hi\" and `yo'",
+        r"5 \* 3": r'5 {\char"002A} 3',
+        "**bold**, *italic* and ***both***": (
+            r"\textbf{bold}, \emph{italic} and \emph{\textbf{both}}"
+        ),
+        "***bold** within italic*": r"\emph{\textbf{bold} within italic}",
+        "***italic* within bold**": r"\textbf{\emph{italic} within bold}",
+        "**a *b* c**": r"\textbf{a \emph{b} c}",
+        "*[a link](https://a.org/a_b)*": r"\emph{\href{https://a.org/a\_b}{a link}}",
+    }
+    for s, expected in cases.items():
+        assert tex.to_latex(s) == expected, (s, tex.to_latex(s))
+
+
+def test_html_preview():
+    cases = {
+        "a & <b> -- c": "a &amp; &lt;b&gt; \u2013 c",
+        """say "hi" and 100%""": "say \u201chi&quot; and 100%",
+        r"5 \* 3": "5 * 3",
+        "**a *b* c**": "<b>a <em>b</em> c</b>",
+        "*[a link](https://a.org/a_b)*": '<em><a href="https://a.org/a_b">a link</a></em>',
+    }
+    for s, expected in cases.items():
+        assert htmlpreview.to_html(s) == expected, (s, htmlpreview.to_html(s))
+
+    with open(TXT_PATH, encoding="utf-8") as f:
+        cv, _ = txtparse.parse(f.read())
+    page = htmlpreview.render(cv=cv, settings=Settings())
+    assert page.startswith("<!DOCTYPE html>")
+    assert htmlpreview.to_html(cv.name) in page
+    assert r"\textbf" not in page and r"\href" not in page
+
+
+def test_format_date():
+    SmartDate = txtparse.SmartDate
+    may_1, may_22 = SmartDate(2023, 5, 1), SmartDate(2023, 5, 22)
+    jun_9 = SmartDate(2023, 6, 9)
+    assert tex.format_date(may_1, "american") == "May 1, 2023"
+    assert tex.format_date(may_1, "british long") == "1 May 2023"
+    assert tex.format_date(may_1, "american slash") == "05/01/2023"
+    assert tex.format_date(SmartDate(2023, 5), "iso") == "2023-05"
+    assert tex.format_date(may_1, "american", may_22) == "May 1--22, 2023"
+    assert tex.format_date(may_1, "british", jun_9) == r"1 May\,--\,9 Jun 2023"
+    assert (
+        tex.format_date(SmartDate(2023, 5), "american long", SmartDate(2023, 6))
+        == r"May\,--\,June 2023"
+    )
+    assert tex.format_date(may_1, "iso", SmartDate(fallback="Present")) == (
+        r"2023-05-01\,--\,Present"
+    )
+
+
+def test_compile_job():
+    with tempfile.TemporaryDirectory() as dest_dir:
+        job = compiler.CompileJob("test", scratch_dir=dest_dir)
+        job.write("\\documentclass{article}")
+        for ext in [".pdf", ".log"]:
+            with open(os.path.join(job.dir, f"job{ext}"), "w") as f:
+                f.write(ext)
+        result = job.collect(dest_dir, returncode=0, keep_log=False)
+        job.cleanup()
+        assert result.ok and result.log_path == ""
+        assert result.pdf_path == os.path.join(dest_dir, "test.pdf")
+        assert os.listdir(dest_dir) == ["test.pdf"]
+
+        # records are of the document, whatever the files are named
+        job = compiler.CompileJob("0007_Jane_Doe", document="Jane Doe")
+        assert job.analyze(0).document == "Jane Doe"
+        job.cleanup()
+        job = compiler.CompileJob("Jane Doe")
+        assert job.analyze(0).document == "Jane Doe"
+        job.cleanup()
+
+
+def test_compile_passes():
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        job = compiler.CompileJob("test", scratch_dir=scratch_dir, draft=True)
+        assert job.args()[0] == "-draftmode"
+        aux_path = os.path.join(job.dir, "job.aux")
+
+        # a pass writing a new label calls for another pass
+        job.begin_pass()
+        with open(aux_path, "w") as f:
+            f.write("\\newlabel{x}{1}")
+        assert job.needs_rerun()
+        job.begin_pass()
+        assert not job.needs_rerun()
+
+        # a draft is done once the references settle, even if the page count
+        # or the pdf outline changed
+        job.begin_pass()
+        with open(aux_path, "w") as f:
+            f.write("\\newlabel{x}{1}\n\\gdef \\@abspage@last{2}")
+        with open(os.path.join(job.dir, "job.out"), "w") as f:
+            f.write("\\BOOKMARK{x}")
+        assert not job.needs_rerun()
+        job.draft = False
+        assert job.needs_rerun()
+
+        # a job seeded with the files of an earlier one may need one pass only
+        seeded = compiler.CompileJob("test", scratch_dir=scratch_dir)
+        seeded.seed(job.snapshot())
+        seeded.begin_pass()
+        assert not seeded.needs_rerun()
+        for j in [job, seeded]:
+            j.cleanup()
+
+
+def test_parse_log():
+    tex_source = "\\section{Awards}\nA very long award name\n\\section{Skills}\n\\foo\n"
+    # broken in two at 79 characters, as TeX does
+    font = (
+        "Package fontspec Info: Font family 'CrimsonPro(0)' created for font"
+        " 'Crimson Pro' with options [Ligatures=TeX]."
+    )
+    log = "\n".join(
+        [
+            font[:79],
+            font[79:],
+            # as long as a broken line, but whole
+            "Package hyperref Info: Link coloring OFF on input line 19.".ljust(79, "."),
+            "Overfull \\hbox (12.5pt too wide) in paragraph at lines 2--2",
+            "Underfull \\vbox (badness 10000) has occurred while \\output is active",
+            "! Undefined control sequence.",
+            "l.4 \\foo",
+            "</usr/share/fonts/CrimsonPro-Regular.otf></usr/share/fonts/lmroman10.otf>",
+            "Output written on job.pdf (2 pages, 12345 bytes).",
+        ]
+    )
+    record = texlog.parse_log(log, tex_source)
+    assert record.pages == 2
+    assert record.fonts == ["Crimson Pro"]
+    assert record.font_files == ["CrimsonPro-Regular.otf", "lmroman10.otf"]
+    overfull, underfull = record.boxes
+    assert (overfull.points, overfull.line, overfull.section) == (12.5, 2, "Awards")
+    assert overfull.source == "A very long award name"
+    assert (underfull.badness, underfull.line) == (10000, None)
+    assert (record.error.line, record.error.source) == (4, "\\foo")
+
+    # new overfull boxes and extra pages are regressions
+    earlier = texlog.CompileRecord(pages=1)
+    assert len(texlog.layout_changes(earlier, record)) == 2
+    assert texlog.layout_changes(record, record) == []
+
+    # the store keeps the latest records, and no more than about max_records
+    with tempfile.TemporaryDirectory() as log_dir:
+        store = texlog.LogStore(os.path.join(log_dir, "log.jsonl"), max_records=4)
+        for i in range(6):
+            store.add(dataclasses.replace(record, document=str(i)))
+        records = store.records()
+        assert [r.document for r in records] == ["2", "3", "4", "5"]
+        assert records[-1] == dataclasses.replace(record, document="5")
+
+
+def test_tightened():
+    settings = Settings(top_margin_in_inch=0.4, line_spread=1.1, font_size_in_point=12)
+    assert fitting.tightened(settings, 0) == settings
+    tightest = fitting.tightened(settings, 1)
+    assert tightest.top_margin_in_inch == 0.4  # tighter than the limit already
+    assert (tightest.line_spread, tightest.font_size_in_point) == (0.9, 10)
+    half = fitting.tightened(settings, 0.5)
+    assert (half.line_spread, half.font_size_in_point) == (1.0, 11)
+    assert half.entry_skip_in_pt == 4
+
+
+class _FakePageCounter:
+    # one page up to a line spread, two above it
+    def __init__(self, max_line_spread: float):
+        self.max_line_spread = max_line_spread
+        self.measured = []
+
+    def count(self, cv, settings):
+        self.measured.append(settings)
+        return 1 if settings.line_spread <= self.max_line_spread else 2
+
+
+def test_fit_to_pages():
+    cv = txtparse.CV(name="Test")
+    settings = Settings(line_spread=1.1, font_size_in_point=12)
+    steps = fitting.FIT_STEPS
+
+    # the loosest step that fits, for every step there is
+    for step in range(steps + 1):
+        fitting_settings = fitting.tightened(settings, step / steps)
+        counter = _FakePageCounter(fitting_settings.line_spread)
+        result = fitting.fit_to_pages(
+            cv, settings, pages=1, counter=counter, progress=lambda _: None
+        )
+        assert result == (fitting_settings, 1)
+        # both ends, then a binary search between them
+        assert len(counter.measured) <= 2 + (steps - 1).bit_length()
+        frozen = {measured.frozen() for measured in counter.measured}
+        assert len(frozen) == len(counter.measured)
+    # settings that fit already are measured once and kept
+    counter = _FakePageCounter(1.1)
+    result = fitting.fit_to_pages(
+        cv, settings, counter=counter, progress=lambda _: None
+    )
+    assert result == (settings, 1)
+    assert counter.measured == [settings]
+
+    # a cv too long for the limits gets the tightest settings, as it is
+    counter = _FakePageCounter(0.5)
+    result = fitting.fit_to_pages(
+        cv, settings, pages=1, counter=counter, progress=lambda _: None
+    )
+    assert result == (fitting.tightened(settings, 1), 2)
+    assert len(counter.measured) == 2
+    # more pages to fit into make it fit
+    result = fitting.fit_to_pages(
+        cv, settings, pages=2, counter=counter, progress=lambda _: None
+    )
+    assert result == (settings, 2)
+
+
+def test_pdf_cache():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache = compiler.PdfCache(os.path.join(tmpdir, "pdfs"), max_bytes=10)
+        tex_path = os.path.join(tmpdir, "job.tex")
+        pdf_path = os.path.join(tmpdir, "job.pdf")
+        keys = []
+        for source in ["first", "second", "first"]:
+            with open(tex_path, "w", encoding="utf-8") as f:
+                f.write(source)
+            keys.append(cache.key(tex_path, template_path=TEMPLATE_PATH))
+        assert keys[0] == keys[2] != keys[1]
+
+        assert cache.get(keys[0]) is None
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF 1")
+        cached_path = cache.put(keys[0], pdf_path)
+        assert cache.get(keys[0]) == cached_path
+        with open(cached_path, "rb") as f:
+            assert f.read() == b"%PDF 1"
+
+        # the least recently used pdf goes once the cache is too large
+        os.utime(cached_path, (0, 0))
+        cache.put(keys[1], pdf_path)
+        assert cache.get(keys[0]) is None
+        assert cache.get(keys[1])
+        assert (cache.hits, cache.misses) == (2, 2)
+
+        # a pdf over the limit by itself is kept until the next one comes
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF " + b"x" * 20)
+        assert os.path.isfile(cache.put(keys[0], pdf_path))
+
+
+def _minimal_font(family: str, subfamily: str) -> bytes:
+    # an sfnt with nothing but a name table, in Windows US English
+    names = [(1, family), (2, subfamily), (4, f"{family} {subfamily}")]
+    strings = b""
+    records = b""
+    for name_id, name in names:
+        raw = name.encode("utf-16-be")
+        records += struct.pack(">6H", 3, 1, 0x409, name_id, len(raw), len(strings))
+        strings += raw
+    name_table = struct.pack(">3H", 0, len(names), 6 + len(records))
+    name_table += records + strings
+    directory = struct.pack(">4sIII", b"name", 0, 28, len(name_table))
+    header = struct.pack(">4s4H", b"\x00\x01\x00\x00", 1, 0, 0, 0)
+    return header + directory + name_table
+
+
+def test_font_index():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for filename, family, subfamily in [
+            ("Garamond.ttf", "EB Garamond", "Regular"),
+            ("GaramondBold.otf", "EB Garamond", "Bold"),
+            ("SansSerif.fon", "MS Sans Serif", "Regular"),
+        ]:
+            with open(os.path.join(tmpdir, filename), "wb") as f:
+                f.write(_minimal_font(family, subfamily))
+        index = fonts.build_index([tmpdir])
+        assert index.families == ["EB Garamond"]
+        assert "eb garamond" in index and "EBGaramond Bold" in index
+        assert "MS Sans Serif" not in index
+        # fontspec also takes file names, with or without the extension
+        assert "GaramondBold.otf" in index and "garamond" in index
+        assert "SansSerif.fon" not in index
+
+        # the fonts of the TeX trees and of OSFONTDIR, as kpsewhich expands them
+        tree = os.path.join(tmpdir, "texmf")
+        os.makedirs(os.path.join(tree, "fonts", "opentype"))
+
+        def kpsewhich(args, **kwargs):
+            if "TEXMFHOME" in args[-1]:
+                return subprocess.CompletedProcess(
+                    args, 0, f"!!{tree}{os.pathsep}$TEXMFLOCAL\n"
+                )
+            return subprocess.CompletedProcess(args, 0, f"{tmpdir}//\n")
+
+        with mock.patch("fonts.subprocess.run", side_effect=kpsewhich):
+            dirs = fonts.font_dirs()
+        assert os.path.join(tree, "fonts", "opentype") in dirs
+        assert os.path.normpath(tmpdir) in dirs
+
+        index_path = os.path.join(tmpdir, "fonts.json")
+        index.save(index_path)
+        loaded = fonts.FontIndex.load(index_path)
+        assert fonts.build_index([tmpdir], previous=loaded).entries == loaded.entries
+
+    settings = Settings(main_font="EB Garamond", title_font="MS Sans Serif")
+    (problem,) = settings.validate(index)
+    assert "MS Sans Serif" in problem
+    assert settings.validate() == []
+
+
+def test_warm_up():
+    calls = []
+    installed = {"EB Garamond"}
+
+    def run(args, **kwargs):
+        calls.append(args)
+        assert kwargs["creationflags"] == tex.NO_WINDOW
+        if args[0] == "luaotfload-tool" and args[1] == "--update":
+            # the update finds the font installed since the last one
+            installed.add("Source Sans Pro")
+        elif args[0] == "luaotfload-tool":
+            family = args[1].removeprefix("--find=")
+            found = family in installed
+            return subprocess.CompletedProcess(
+                args, 0 if found else 1, "" if found else f'Cannot find "{family}"'
+            )
+        return subprocess.CompletedProcess(args, 0, "")
+
+    progress = []
+    with mock.patch("fonts.subprocess.run", side_effect=run):
+        missing = fonts.warm_up(
+            ["EB Garamond", "Source Sans Pro", "Nonexistent", "EB Garamond", ""],
+            progress=progress.append,
+        )
+    assert missing == ["Nonexistent"]
+    assert calls[:3] == [
+        ["luaotfload-tool", "--find=EB Garamond"],
+        ["luaotfload-tool", "--find=Source Sans Pro"],
+        ["luaotfload-tool", "--find=Nonexistent"],
+    ]
+    # only the families missing before the update are looked up again
+    assert calls[3:6] == [
+        ["luaotfload-tool", "--update"],
+        ["luaotfload-tool", "--find=Source Sans Pro"],
+        ["luaotfload-tool", "--find=Nonexistent"],
+    ]
+    # the fonts found are then loaded once, by a single lualatex run
+    ((lualatex, *_),) = calls[6:]
+    assert lualatex == "lualatex"
+    assert "Font not found: Nonexistent" in progress
+    assert progress[-1].startswith("Fonts ready")
+
+
+_HTML_PREVIEW_SCRIPT = """
+import os
+from PyQt6.QtWidgets import QApplication
+
+app = QApplication([])
+import gui
+
+# no font lookups, which are slow and write the font index
+gui.MainWindow._load_font_index = gui.MainWindow._warm_up_fonts = lambda self: None
+window = gui.MainWindow()
+window.show()
+# turned on, off and on again, the preview has room to show in
+for state in [True, False, True]:
+    window.toggle_html_preview(state)
+    app.processEvents()
+    assert window.html_view.isVisible() == state
+assert window.html_view.width() > 0, window.centralWidget().sizes()
+assert window.editor.width() > 0, window.centralWidget().sizes()
+os._exit(0)
+"""
+
+
+def test_html_preview_width():
+    # with PyQt6 only, offscreen, and in a process of its own, which leaves
+    # without tearing the widgets down
+    try:
+        import PyQt6.QtWidgets
+    except ImportError:
+        print("Skipped test_html_preview_width: PyQt6 not found")
+        return
+    process = subprocess.run(
+        [sys.executable, "-c", _HTML_PREVIEW_SCRIPT],
+        env={**os.environ, "QT_QPA_PLATFORM": "offscreen"},
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert process.returncode == 0, process.stderr
+
+
+def test_cvpack():
+    with open(TXT_PATH, encoding="utf-8") as f:
+        src = f.read()
+    cvs = [txtparse.parse(src)[0], txtparse.CV(name="Empty")]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "cvs.bin")
+        cvpack.dump(cvs, path)
+        loaded = cvpack.load(path)
+    assert [cv.to_json() for cv in loaded] == [cv.to_json() for cv in cvs]
+    # indexes and interned dates survive the round trip
+    assert loaded[0].last_education.school == cvs[0].last_education.school
+    assert loaded[0].tests[0].date is cvs[0].tests[0].date
+    data = cvpack.dumps_cv(cvs[0])
+    assert cvpack.loads_cv(data).to_json() == cvs[0].to_json()
+    # a date whose fallback is a string number out of range
+    _, _, _, n_strings, n_dates, _, _ = cvpack._HEADER.unpack_from(data)
+    offset = cvpack._HEADER.size + 4 * n_strings
+    offset += 4 + struct.unpack_from("<I", data, offset)[0] + 4 * n_dates
+    bad_date = data[:offset] + b"\xff" * 4 + data[offset + 4 :]
+    for corrupt in [data[:-1], data[:4] + b"\xff" + data[5:], b"", bad_date]:
+        try:
+            cvpack.loads(corrupt)
+        except cvpack.FormatError:
+            pass
+        else:
+            raise AssertionError(f"loaded corrupt data: {corrupt[:8]!r}")
 
 
 def test_doc_parse():
     cv, unparsed = txtparse.parse(docparse.parse(DOC_PATH))
     _print_parsed(cv, unparsed)
+    _check_sample(cv)
+    assert unparsed == []
+    # links are lost in the docx
+    assert "like this one, will be lost" in cv.activities[1].descriptions[1]
+
+
+def _check_sample(cv: txtparse.CV):
+    # the cv of both samples, as parsed before the keyword schema
+    assert (cv.name, cv.email, cv.phone, cv.address) == (
+        "Fictional Character Guido",
+        "guido@python.org",
+        "(123) 456-7890",
+        "",
+    )
+    assert cv.website == "https://gvanrossum.github.io/"
+
+    master, bachelor, day_care = cv.education
+    assert (master.school, master.loc) == (
+        "University of Amsterdam",
+        "Amsterdam, The Netherlands",
+    )
+    assert (master.start_date.year, master.start_date.month) == (1981, 9)
+    assert (master.end_date.year, master.end_date.month) == (1982, None)
+    assert master.degree == "Master in Mathematics & Computer Science"
+    assert (master.gpa, master.rank) == ("\\textsc{unknown}", "1/42")
+    assert master.courses == "AP Spam (5), AP Egg (5), AP Silly Walk (5)"
+    assert (bachelor.minor, bachelor.end_date.day) == ("Mathematics", 30)
+    assert (day_care.school, day_care.rank) == ("Amsterdam Day Care", "kick-ass")
+
+    assert cv.activity_sections == ["Work Experience", "Projects"]
+    assert [(a.role, a.section) for a in cv.activities] == [
+        ("Distinguished Engineer", "Work Experience"),
+        ("Senior Staff Software Engineer", "Work Experience"),
+        ("Creator", "Projects"),
+        ("Contributor", "Projects"),
+    ]
+    engineer, google, creator, _ = cv.activities
+    assert (engineer.org, engineer.loc) == (
+        "Microsoft, Inc.",
+        "San Francisco, California",
+    )
+    assert (engineer.start_date.day, engineer.end_date.fallback) == (12, "Present")
+    assert len(engineer.descriptions) == 2 and len(google.descriptions) == 3
+    assert (google.hours_per_week, google.weeks_per_year) == ("1", "")
+    assert (creator.hours_per_week, creator.weeks_per_year) == ("14", "40")
+
+    assert [(a.name, a.date.year, a.date.month) for a in cv.awards[:2]] == [
+        ("Dijkstra Fellowship by CWI", 2019, 11),
+        ("ACM Distinguished Engineer", 2006, 10),
+    ]
+    assert len(cv.awards) == 3
+    assert [(t.name, t.score, t.date.year) for t in cv.tests] == [
+        ("SAT", "xxxx", 2023),
+        ("TOEFL", "xxx (L/S/R/W)", 2023),
+    ]
+    assert [(s.name, s.skills) for s in cv.skillsets] == [
+        ("Programming Languages", "Python, C, C++"),
+        ("Tools & Technologies", "Git, Docker, Jenkins, Jupyter Notebook"),
+    ]
 
 
 def _print_parsed(cv: txtparse.CV, unparsed: list):
@@ -96,6 +864,31 @@ def run_lualatex(
 
 if __name__ == "__main__":
     test_txt_parse()
+    test_txt_parse_iter()
+    test_parse_many()
+    test_incremental_parse()
+    test_memory_budget()
+    test_date_order()
+    test_cv_indexes()
+    test_cv_indexes_copy()
+    test_corpus_table()
+    test_template_cache()
+    test_render_to()
+    test_frozen_settings()
+    test_render_many()
+    test_to_latex()
+    test_format_date()
+    test_html_preview()
+    test_compile_job()
+    test_compile_passes()
+    test_parse_log()
+    test_pdf_cache()
+    test_tightened()
+    test_fit_to_pages()
+    test_font_index()
+    test_warm_up()
+    test_html_preview_width()
+    test_cvpack()
     test_doc_parse()
     test_json_read_write()
     test_render()
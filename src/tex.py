@@ -1,13 +1,70 @@
+import contextlib
 import dataclasses
+import functools
+import hashlib
 import json
+import os
 import re
 import datetime
+import io
+import subprocess
+import sys
+import typing
+import concurrent.futures
 
 import jinja2
 
 from txtparse import CV, SmartDate
 
+# Passed to the subprocesses the gui starts, so that a console window does
+# not flash up on Windows each time
+NO_WINDOW = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+
+
+class RenderError(Exception):
+    pass
+
+
+# Compiled templates are kept here across runs (and shipped with the frozen
+# build), so that a template is compiled only once until it changes
+TEMPLATE_CACHE_DIR = "templates/__jinjacache__"
+
+
+class _PathLoader(jinja2.BaseLoader):
+    """Load templates by their file paths, reloading a template whenever its
+    file has been modified."""
+
+    def get_source(self, environment, template):
+        try:
+            mtime = os.path.getmtime(template)
+            with open(template, encoding="utf-8") as template_file:
+                source = template_file.read()
+        except FileNotFoundError:
+            raise jinja2.TemplateNotFound(template)
+
+        def uptodate():
+            try:
+                return os.path.getmtime(template) == mtime
+            except OSError:
+                return False
+
+        return source, template, uptodate
+
+
+class _BytecodeCache(jinja2.FileSystemBytecodeCache):
+    def dump_bytecode(self, bucket):
+        # the cache is an optimization; rendering goes on without it
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
+
+
 ENVIRONMENT = jinja2.Environment(
+    loader=_PathLoader(),
+    bytecode_cache=_BytecodeCache(TEMPLATE_CACHE_DIR),
+    auto_reload=True,
     block_start_string="<!",
     block_end_string="!>",
     variable_start_string="<<",
@@ -84,43 +141,338 @@ class Settings:
         with open(filepath, encoding="utf-8") as f:
             return cls(**json.load(f))
 
+    def validate(self, fonts: typing.Container[str] | None = None) -> list[str]:
+        """Problems with these settings that would make lualatex fail, or an
+        empty list. Fonts are checked against `fonts`, the names of the fonts
+        lualatex can load, if given."""
+        problems = []
+        for field in dataclasses.fields(self):
+            try:
+                _canonical(field.name, getattr(self, field.name), field.type)
+            except ValueError as e:
+                problems.append(str(e))
+        if fonts is not None:
+            for label, font in [
+                ("Text font", self.main_font),
+                ("Heading font", self.heading_font),
+                ("Title font", self.title_font),
+            ]:
+                # no font means the default, which is always there
+                if font and font not in fonts:
+                    problems.append(
+                        f"{label} {font!r} is not an OpenType or TrueType font"
+                        " installed on this computer"
+                    )
+        if self.date_style not in DATE_STYLES:
+            problems.append(f"Unknown date style {self.date_style!r}")
+        font_size = self.frozen().font_size_in_point
+        if isinstance(font_size, int) and font_size <= 0:
+            problems.append(f"Invalid font size {font_size}")
+        return problems
+
+    def frozen(self) -> "FrozenSettings":
+        """The canonical form of these settings, immutable and hashable:
+        every value of its declared type, and floats rounded to FLOAT_DIGITS
+        digits, so that e.g. 0.9999999999999999 and 1.0 make equal forms.
+
+        A value that does not convert to its type as it is, e.g. 6.5 for a
+        whole number or "yes" for a boolean, is kept as it is, and rendered
+        as before; validate() reports it.
+        """
+        values = {}
+        for field in dataclasses.fields(self):
+            value = getattr(self, field.name)
+            try:
+                values[field.name] = _canonical(field.name, value, field.type)
+            except ValueError:
+                values[field.name] = value
+        return FrozenSettings(**values)
+
+
+# Far more precise than any setting widget, and imprecise enough to absorb
+# the rounding errors of the spin boxes
+FLOAT_DIGITS = 6
+
+# The settings used in the `preamble` block of the templates (see
+# render_preamble); the others only affect the rest of the document
+PREAMBLE_FIELDS = frozenset({"paper", "font_size_in_point"})
+
+
+# Booleans as they may be spelled in text, e.g. in hand-edited settings
+_BOOL_STRINGS = {"true": True, "false": False}
+
+
+def _canonical(name: str, value, type_):
+    # `value` of setting `name` as a `type_`; raise ValueError rather than
+    # change it, as bool("false"), which is True, or int(6.5) would
+    if type_ is bool:
+        if isinstance(value, str) and value.lower() in _BOOL_STRINGS:
+            return _BOOL_STRINGS[value.lower()]
+        if isinstance(value, (bool, int)) and value in (0, 1):
+            return bool(value)
+    elif type_ is int:
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, (int, str)):
+            with contextlib.suppress(ValueError):
+                return int(value)
+    elif type_ is float:
+        if isinstance(value, (int, float, str)):
+            with contextlib.suppress(ValueError):
+                # + 0.0 turns -0.0 into 0.0
+                return round(float(value), FLOAT_DIGITS) + 0.0
+    else:
+        return type_(value)
+    raise ValueError(f"Invalid {type_.__name__} for {name}: {value!r}")
+
+
+class _SettingsKeys:
+    # cache keys for FrozenSettings, computed once per instance
+
+    @functools.cached_property
+    def fingerprint(self) -> str:
+        """A digest of all the settings."""
+        return self._digest(field.name for field in dataclasses.fields(self))
+
+    @functools.cached_property
+    def preamble_digest(self) -> str:
+        """A digest of the settings in PREAMBLE_FIELDS, which is all that the
+        preamble block of a template depends on."""
+        return self._digest(PREAMBLE_FIELDS)
+
+    @functools.cached_property
+    def body_digest(self) -> str:
+        """A digest of the settings not in PREAMBLE_FIELDS."""
+        return self._digest(
+            field.name
+            for field in dataclasses.fields(self)
+            if field.name not in PREAMBLE_FIELDS
+        )
+
+    def frozen(self):
+        return self
+
+    def thaw(self) -> Settings:
+        return Settings(**dataclasses.asdict(self))
+
+    def _digest(self, names: typing.Iterable[str]) -> str:
+        # the same on every run and platform, unlike hash()
+        items = sorted((name, getattr(self, name)) for name in names)
+        data = json.dumps(items, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(data).hexdigest()[:16]
+
+
+# Settings made by Settings.frozen, with the same fields; templates can be
+# rendered with either
+FrozenSettings = dataclasses.make_dataclass(
+    "FrozenSettings",
+    [
+        (field.name, field.type, dataclasses.field(default=field.default))
+        for field in dataclasses.fields(Settings)
+    ],
+    bases=(_SettingsKeys,),
+    frozen=True,
+)
+FrozenSettings.__module__ = __name__  # for pickling, e.g. by render_many
+
 
 def render(*, template_path: str, cv: CV, settings: Settings):
-    with open(template_path, encoding="utf-8") as template_file:
-        template_str = template_file.read()
-    template = ENVIRONMENT.from_string(template_str)
-    return template.render(cv=cv, settings=settings)
+    # compiled templates are cached by ENVIRONMENT under their absolute paths
+    template = ENVIRONMENT.get_template(os.path.abspath(template_path))
+    # canonical settings render identical documents for equal settings,
+    # which the caches keyed by documents rely on
+    return template.render(cv=cv, settings=settings.frozen())
+
+
+def generate(*, template_path: str, cv: CV, settings: Settings):
+    """Render a cv chunk by chunk."""
+    template = ENVIRONMENT.get_template(os.path.abspath(template_path))
+    return template.generate(cv=cv, settings=settings.frozen())
+
+
+def render_to(
+    file: typing.IO, *, template_path: str, cv: CV, settings: Settings
+) -> None:
+    """Write a rendered cv to `file` as it is rendered, without holding the
+    whole document in memory. To a binary file, such as the stdin of a
+    process, the document is written in utf-8."""
+    if isinstance(file, io.TextIOBase):
+        write = file.write
+    else:
+        write = lambda chunk: file.write(chunk.encode("utf-8"))
+    for chunk in generate(template_path=template_path, cv=cv, settings=settings):
+        write(chunk)
+
+
+def render_preamble(*, template_path: str, settings: Settings) -> str:
+    """Render the `preamble` block of a template, i.e. the part of the
+    preamble that sets up the page; it must not depend on the cv, nor on
+    settings other than PREAMBLE_FIELDS."""
+    template = ENVIRONMENT.get_template(os.path.abspath(template_path))
+    context = template.new_context({"settings": settings.frozen()})
+    return "".join(template.blocks["preamble"](context))
+
+
+@functools.cache
+def lualatex_version() -> str:
+    try:
+        process = subprocess.run(
+            ["lualatex", "--version"],
+            capture_output=True,
+            text=True,
+            creationflags=NO_WINDOW,
+        )
+    except OSError:
+        return ""
+    return process.stdout.partition("\n")[0]
+
+
+def render_many(
+    cvs: typing.Iterable[CV] | typing.Mapping[typing.Hashable, CV],
+    settings: Settings,
+    template_path: str,
+    *,
+    workers: int | None = None,
+) -> typing.Iterator[tuple[typing.Hashable, str | RenderError]]:
+    """Render many cvs on a pool of processes, yielding (cv id, tex source)
+    as the cvs are rendered. The ids are the keys of `cvs` if it is a
+    mapping, or else the positions of the cvs in it.
+
+    A cv that fails to render is yielded with a RenderError in place of its
+    tex source; the other cvs are rendered all the same.
+    """
+    items = list(cvs.items() if isinstance(cvs, typing.Mapping) else enumerate(cvs))
+    if not items:
+        return
+    # compile here first, to fail early on template errors and to fill the
+    # bytecode cache the workers load the template from
+    template_path = os.path.abspath(template_path)
+    ENVIRONMENT.get_template(template_path)
+
+    workers = workers or os.cpu_count() or 1
+    batch_size = min(16, -(-len(items) // (workers * 4)))  # ceiling division
+    batches = [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+    executor = concurrent.futures.ProcessPoolExecutor(
+        workers,
+        initializer=_init_render_worker,
+        initargs=(template_path, settings),
+    )
+    try:
+        futures = {executor.submit(_render_batch, batch): batch for batch in batches}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                yield from future.result()
+            except Exception as e:
+                # e.g. a worker died; every cv of its batch failed
+                for cv_id, _ in futures[future]:
+                    yield cv_id, RenderError(f"{type(e).__name__}: {e}")
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# the template and settings of a render_many worker process
+_worker_template = None
+_worker_settings = None
+
+
+def _init_render_worker(template_path: str, settings: Settings):
+    global _worker_template, _worker_settings
+    _worker_template = ENVIRONMENT.get_template(template_path)
+    _worker_settings = settings.frozen()
+
+
+def _render_batch(batch: list[tuple[typing.Hashable, CV]]):
+    results = []
+    for cv_id, cv in batch:
+        try:
+            tex_source = _worker_template.render(cv=cv, settings=_worker_settings)
+        except Exception as e:
+            results.append((cv_id, RenderError(f"{type(e).__name__}: {e}")))
+        else:
+            results.append((cv_id, tex_source))
+    return results
+
+
+# a character of emphasized text; an escaped asterisk counts as one
+_TEXT_CHAR = r"(?:\\\*|(?!\\\*)[^*])"
+_BOLD_SPAN = rf"\*\*{_TEXT_CHAR}+?\*\*"
+_ITALIC_SPAN = rf"\*{_TEXT_CHAR}+?\*(?!\*)"
+
+# Everything to_latex may rewrite, and htmlpreview.to_html too; at a given
+# position the first alternative that matches wins. An italic span may
+# contain bold spans and vice versa, and no italic span opens or closes at
+# the first asterisk of a bold span. The leading lookahead lets the regex
+# engine skip plain text quickly.
+LATEX_TOKEN = re.compile(
+    rf"""
+    (?=[\\*\[_#$%&^~"'])
+    (?:
+    (?P<escaped_asterisk>\\\*)
+    | \*\*\*(?P<bold_italic>{_TEXT_CHAR}+?)\*\*\*
+    | \*\*(?P<bold>(?:{_ITALIC_SPAN}|{_TEXT_CHAR})+?)\*\*
+    | \*(?!{_BOLD_SPAN[2:]})
+      (?P<italic>(?:{_BOLD_SPAN}|{_TEXT_CHAR})+?)
+      \*(?!{_BOLD_SPAN[2:]})
+    | \[(?P<link_text>.+?)\]\((?P<url>.+?)\)
+    | (?P<special>[_#$%&])
+    | (?P<caret>\^)
+    | (?P<tilde>~)
+    | (?P<quote>["'])
+    )
+    """,
+    flags=re.VERBOSE,
+)
 
 
+@functools.lru_cache(maxsize=4096)
 def to_latex(s: str):
     # Generic filter:
     # - escape special characters
     # - correct quotes
     # - implement markdown syntax for italic, bold, and url
-
-    # preserve escaped asterisks
-    s = s.replace("\\*", '{\\char"002A}')
-
-    # escape `_`, '#', `$`, '%', `&`, '^', '~'
-    s = re.sub("([_#$%&])", r"\\\1", s)
-    s = s.replace("^", "\\^{}")
-    s = s.replace("~", "\\textasciitilde{}")
-
-    # correct quotes
-    s = re.sub(r'(^|\s)"', r"\1``", s)
-    s = re.sub(r"(^|\s)'", r"\1`", s)
-
-    # bold and italic
-    passes = 0
-    while s.count("*") and passes < 3:
-        s = re.sub(r"\*\*([^*]+?)\*\*", r"\\textbf{\1}", s)
-        s = re.sub(r"\*([^*]+?)\*", r"\\emph{\1}", s)
-        passes += 1
-
-    # url
-    s = re.sub(r"\[(.+?)\]\((.+?)\)", r"\\href{\2}{\1}", s)
-
-    return s
+    # Cached, since many strings (school names, section titles etc.) recur
+    return _to_latex(s, 0, len(s))
+
+
+def _to_latex(s: str, start: int, end: int) -> str:
+    # Convert s[start:end] in one scan; emphasized and linked text is
+    # converted recursively. Scanning the whole string rather than a slice
+    # of it keeps what precedes a quote visible to the pattern.
+    chunks = []
+    for mo in LATEX_TOKEN.finditer(s, start, end):
+        chunks.append(s[start : mo.start()])
+        start = mo.end()
+        kind = mo.lastgroup
+        if kind == "escaped_asterisk":
+            chunks.append('{\\char"002A}')
+        elif kind == "special":
+            chunks.append(f"\\{mo.group(kind)}")
+        elif kind == "caret":
+            chunks.append("\\^{}")
+        elif kind == "tilde":
+            chunks.append("\\textasciitilde{}")
+        elif kind == "quote":
+            # only opening quotes, at the start or after a space, change
+            if mo.start() and not s[mo.start() - 1].isspace():
+                chunks.append(mo.group(kind))
+            elif mo.group(kind) == '"':
+                chunks.append("``")
+            else:
+                chunks.append("`")
+        elif kind == "url":
+            text = _to_latex(s, *mo.span("link_text"))
+            url = _to_latex(s, *mo.span("url"))
+            chunks.append(f"\\href{{{url}}}{{{text}}}")
+        else:
+            inner = _to_latex(s, *mo.span(kind))
+            if kind == "bold_italic":
+                chunks.append(f"\\emph{{\\textbf{{{inner}}}}}")
+            elif kind == "bold":
+                chunks.append(f"\\textbf{{{inner}}}")
+            else:
+                chunks.append(f"\\emph{{{inner}}}")
+    chunks.append(s[start:end])
+    return "".join(chunks)
 
 
 ENVIRONMENT.filters["to_latex"] = to_latex
@@ -136,6 +488,70 @@ def null_or_prefixed(s: str, prefix: str) -> str:
 ENVIRONMENT.filters["null_or_prefixed"] = null_or_prefixed
 
 
+MONTH_NAMES = [
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+    "August",
+    "September",
+    "October",
+    "November",
+    "December",
+]
+MONTH_ABBRS = [name[:3] for name in MONTH_NAMES]
+
+# date style -> (format of a date with a day, format of a date without)
+# Fields: year; month (name), mon (abbreviated name) and mm (zero-padded);
+# day and dd (zero-padded)
+DATE_FORMATS = {
+    "american": ("{mon} {day}, {year}", "{mon} {year}"),
+    "american long": ("{month} {day}, {year}", "{month} {year}"),
+    "american slash": ("{mm}/{dd}/{year}", "{mm}/{year}"),
+    "british": ("{day} {mon} {year}", "{mon} {year}"),
+    "british long": ("{day} {month} {year}", "{month} {year}"),
+    "british slash": ("{dd}/{mm}/{year}", "{mm}/{year}"),
+    "iso": ("{year}-{mm}-{dd}", "{year}-{mm}"),
+    "yyyy/mm/dd": ("{year}/{mm}/{dd}", "{year}/{mm}"),
+}
+DATE_STYLES = list(DATE_FORMATS)
+
+# Date styles in which two dates of the same year are consolidated:
+# date style -> (format for different months without days,
+#                format for different days in the same month,
+#                format for different days in different months)
+# Fields are those of DATE_FORMATS suffixed with 1 or 2, and the dashes
+_RANGE_FORMATS = {
+    "american": (
+        "{mon1}{dash}{mon2} {year}",
+        "{mon1} {day1}{day_dash}{day2}, {year}",
+        "{mon1} {day1}{dash}{mon2} {day2}, {year}",
+    ),
+    "american long": (
+        "{month1}{dash}{month2} {year}",
+        "{month1} {day1}{day_dash}{day2}, {year}",
+        "{month1} {day1}{dash}{month2} {day2}, {year}",
+    ),
+    "british": (
+        "{mon1}{dash}{mon2} {year}",
+        "{day1}{day_dash}{day2} {mon1} {year}",
+        "{day1} {mon1}{dash}{day2} {mon2} {year}",
+    ),
+    "british long": (
+        "{month1}{dash}{month2} {year}",
+        "{day1}{day_dash}{day2} {month1} {year}",
+        "{day1} {month1}{dash}{day2} {month2} {year}",
+    ),
+}
+
+DATE_DASH = r"\,--\,"  # between dates
+DAY_DASH = "--"  # between days
+
+
+@functools.lru_cache(maxsize=4096)
 def format_date(
     date1: SmartDate | None,
     style: str,
@@ -143,6 +559,7 @@ def format_date(
 ) -> str:
     # date2, if given, should be a later date than date1
     # but the function will not check if this is the case
+    # Cached, since many entries across cvs share their dates
     str1 = format_single_date(date1, style)
     str2 = format_single_date(date2, style)
 
@@ -159,21 +576,14 @@ def format_date(
     # - the two objects have different `year` values
     # - the two objects have different resolutions
     # - the style is not one of the consolidatable style
-    dash = "\,--\,"
-    consolidatable_styles = [
-        "american",
-        "american long",
-        "british",
-        "british long",
-    ]
     if (
         not date1.is_date
         or not date2.is_date
         or (date1.year != date2.year)
         or (date1.resolution != date2.resolution)
-        or style not in consolidatable_styles
+        or style not in _RANGE_FORMATS
     ):
-        return f"{str1}{dash}{str2}"
+        return f"{str1}{DATE_DASH}{str2}"
 
     # Consolidation required if both SmartDates are real dates
     # with identical `year` values and resolutions, and
@@ -181,50 +591,27 @@ def format_date(
     # - different months without `day` values: May-Jun 2023
     # - different days in the same month: May 22-24, 2023,
     # - different days in different months: May 22 - June 22, 2023
-    fulldate1: datetime.date = date1.as_date
-    fulldate2: datetime.date = date2.as_date
-    year = date1.year
-    m1 = fulldate1.strftime("%b")
-    m2 = fulldate2.strftime("%b")
-    mm1 = fulldate1.strftime("%B")
-    mm2 = fulldate2.strftime("%B")
-    # NOTE the hash sign is windows specific
-    d1 = fulldate1.strftime("%#d")
-    d2 = fulldate2.strftime("%#d")
-
-    day_dash = "--"  # between days
-
-    # Different months without `day` values
-    if date1.day is None and style in ["american", "british"]:
-        return f"{m1}{dash}{m2} {year}"
-    elif date1.day is None:
-        return f"{mm1}{dash}{mm2} {year}"
-
-    # Different days in the same month
+    months_only, same_month, different_months = _RANGE_FORMATS[style]
+    if date1.day is None:
+        range_format = months_only
     elif date1.month == date2.month:
-        if style == "american":
-            return f"{m1} {d1}{day_dash}{d2}, {year}"
-        if style == "american long":
-            return f"{mm1} {d1}{day_dash}{d2}, {year}"
-        if style == "british":
-            return f"{d1}{day_dash}{d2} {m1} {year}"
-        if style == "british long":
-            return f"{d1}{day_dash}{d2} {mm1} {year}"
-
-    # Different days in different months
-    elif style == "american":
-        return f"{m1} {d1}{dash}{m2}{d2}, {year}"
-    elif style == "american long":
-        return f"{mm1} {d1}{dash}{mm2}{d2}, {year}"
-    elif style == "british":
-        return f"{d1} {m1}{dash}{d2}{m2} {year}"
-    elif style == "british long":
-        return f"{d1} {mm1}{dash}{d2}{mm2} {year}"
-
+        range_format = same_month
     else:
-        raise ValueError((date1, date2, style))
-
-
+        range_format = different_months
+    return range_format.format(
+        year=date1.year,
+        month1=MONTH_NAMES[date1.month - 1],
+        month2=MONTH_NAMES[date2.month - 1],
+        mon1=MONTH_ABBRS[date1.month - 1],
+        mon2=MONTH_ABBRS[date2.month - 1],
+        day1=date1.day,
+        day2=date2.day,
+        dash=DATE_DASH,
+        day_dash=DAY_DASH,
+    )
+
+
+@functools.lru_cache(maxsize=4096)
 def format_single_date(d: SmartDate | None, style: str) -> str:
     if d is None:
         return ""
@@ -233,28 +620,16 @@ def format_single_date(d: SmartDate | None, style: str) -> str:
     if d.month is None:
         return str(d.year)
 
-    # (style, d.day is not None) -> formatter
-    style_map = {
-        ("american", True): "%b %#d, %Y",
-        ("american", False): "%b %Y",
-        ("american long", True): "%B %#d, %Y",
-        ("american long", False): "%B %Y",
-        ("american slash", True): "%m/%d/%Y",
-        ("american slash", False): "%m/%Y",
-        ("british", True): "%#d %b %Y",
-        ("british", False): "%b %Y",
-        ("british long", True): "%#d %B %Y",
-        ("british long", False): "%B %Y",
-        ("british slash", True): "%d/%m/%Y",
-        ("british slash", False): "%m/%Y",
-        ("iso", True): "%Y-%m-%d",
-        ("iso", False): "%Y-%m",
-        ("yyyy/mm/dd", True): "%Y/%m/%d",
-        ("yyyy/mm/dd", False): "%Y/%m",
-    }
-    date = datetime.date(year=d.year, month=d.month, day=d.day or 1)
-    format_str = style_map[style, d.day is not None]
-    return date.strftime(format_str)
+    with_day, without_day = DATE_FORMATS[style]
+    date_format = with_day if d.day is not None else without_day
+    return date_format.format(
+        year=d.year,
+        month=MONTH_NAMES[d.month - 1],
+        mon=MONTH_ABBRS[d.month - 1],
+        mm=f"{d.month:02}",
+        day=d.day,
+        dd=f"{d.day or 1:02}",
+    )
 
 
 ENVIRONMENT.filters["format_date"] = format_date
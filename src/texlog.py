@@ -0,0 +1,294 @@
+import dataclasses
+import json
+import os
+import re
+import threading
+import typing
+
+# Compile records are kept here across runs, the oldest dropped first
+COMPILE_LOG_PATH = "logs/compiles.jsonl"
+MAX_RECORDS = 10000
+
+# TeX breaks the lines of its log at this many bytes
+MAX_PRINT_LINE = 79
+
+_BOX = re.compile(
+    r"^(?P<kind>Overfull|Underfull) \\(?P<box>[hv]box) "
+    r"\((?:(?P<points>[\d.]+)pt too \w+|badness (?P<badness>\d+))\)"
+    r"(?:.*? lines? (?P<line>\d+))?",
+    re.MULTILINE,
+)
+_ERROR = re.compile(r"^! (?P<message>.+)$", re.MULTILINE)
+_ERROR_LINE = re.compile(r"^l\.(?P<line>\d+) ?(?P<context>.*)$", re.MULTILINE)
+_FONTSPEC_FONT = re.compile(r"Font family '[^']*' created for font '(?P<font>[^']+)'")
+_FONT_FILE = re.compile(r"<(?P<path>[^<>\n]+\.(?:otf|ttf|otc|ttc|pfb))>")
+_PAGES = re.compile(r"Output written on .*?\((?P<pages>\d+) pages?")
+_SECTION = re.compile(r"\\section\{(?P<title>.*)\}")
+
+# the messages parse_log looks for, and the other messages of LaTeX and
+# its packages; a line starting with one does not go on with the line
+# before
+_MESSAGE_START = re.compile(
+    r"(?:Overfull|Underfull) \\[hv]box |! |l\.\d+ |Output written on "
+    r"|(?:LaTeX|Package|Class|Module) (?:\S+ )?(?:Info|Warning|Error)"
+)
+
+
+@dataclasses.dataclass
+class BoxWarning:
+    kind: str  # "Overfull" or "Underfull"
+    box: str  # "hbox" or "vbox"
+    points: float | None  # how far an overfull box sticks out
+    badness: int | None  # how loose an underfull box is
+    # the line of the document where the box starts, the title of the
+    # section it is in, and the text of the line, i.e. the cv entry; none of
+    # these is known of boxes found while a page is put together
+    line: int | None = None
+    section: str = ""
+    source: str = ""
+
+    def describe(self) -> str:
+        if self.points is not None:
+            amount = f"{self.points}pt too {'wide' if self.box == 'hbox' else 'high'}"
+        else:
+            amount = f"badness {self.badness}"
+        where = f" at line {self.line}" if self.line else ""
+        if self.section:
+            where = f"{where} in {self.section}"
+        description = f"{self.kind} \\{self.box} ({amount}){where}"
+        return f"{description}: {self.source}" if self.source else description
+
+
+@dataclasses.dataclass
+class LogError:
+    message: str
+    line: int | None = None
+    context: str = ""  # the input up to where TeX stopped
+    source: str = ""  # the whole line of the document
+
+    def describe(self) -> str:
+        if self.line is None:
+            return self.message
+        return f"{self.message} (line {self.line}: {self.source or self.context})"
+
+
+@dataclasses.dataclass
+class CompileRecord:
+    """What a compile did and how long it took, from its log."""
+
+    document: str = ""
+    finished: float = 0.0  # seconds since the epoch
+    returncode: int = 0
+    pass_seconds: list[float] = dataclasses.field(default_factory=list)
+    draft: bool = False
+    pages: int | None = None
+    fonts: list[str] = dataclasses.field(default_factory=list)  # as named
+    font_files: list[str] = dataclasses.field(default_factory=list)  # embedded
+    boxes: list[BoxWarning] = dataclasses.field(default_factory=list)
+    error: LogError | None = None
+
+    @property
+    def seconds(self) -> float:
+        return sum(self.pass_seconds)
+
+    @property
+    def overfull(self) -> list[BoxWarning]:
+        return [box for box in self.boxes if box.kind == "Overfull"]
+
+    @property
+    def underfull(self) -> list[BoxWarning]:
+        return [box for box in self.boxes if box.kind == "Underfull"]
+
+    def summary(self) -> str:
+        passes = ", ".join(f"{seconds:.1f}" for seconds in self.pass_seconds)
+        parts = [
+            f"{len(self.pass_seconds)} pass(es) ({passes} s)",
+            f"{self.pages if self.pages is not None else '?'} page(s)",
+            f"{len(self.overfull)} overfull and {len(self.underfull)} underfull boxes",
+        ]
+        return "; ".join(parts)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CompileRecord":
+        data = dict(data)
+        data["boxes"] = [BoxWarning(**box) for box in data.get("boxes", [])]
+        if data.get("error"):
+            data["error"] = LogError(**data["error"])
+        return cls(**data)
+
+
+def parse_log(log: str, tex_source: str = "") -> CompileRecord:
+    """A record of the fonts, box warnings, first error and page count
+    found in the text of a lualatex log. With the document that was
+    compiled, warnings and errors are traced back to its lines."""
+    log = _unwrap(log)
+    tex_lines = tex_source.splitlines()
+    sections = _sections(tex_lines)
+
+    def source(line: int | None) -> tuple[str, str]:
+        # the section title and text of a line of the document
+        if line is None or not 0 < line <= len(tex_lines):
+            return "", ""
+        return sections[line - 1], tex_lines[line - 1].strip()
+
+    boxes = []
+    for mo in _BOX.finditer(log):
+        line = int(mo.group("line")) if mo.group("line") else None
+        section, text = source(line)
+        boxes.append(
+            BoxWarning(
+                kind=mo.group("kind"),
+                box=mo.group("box"),
+                points=float(mo.group("points")) if mo.group("points") else None,
+                badness=int(mo.group("badness")) if mo.group("badness") else None,
+                line=line,
+                section=section,
+                source=text,
+            )
+        )
+
+    error = None
+    if mo := _ERROR.search(log):
+        error = LogError(message=mo.group("message").strip())
+        # TeX shows where it stopped a few lines after the message
+        if line_mo := _ERROR_LINE.search(log, mo.end()):
+            error.line = int(line_mo.group("line"))
+            error.context = line_mo.group("context").strip()
+            _, error.source = source(error.line)
+
+    pages_mo = _PAGES.search(log)
+    return CompileRecord(
+        pages=int(pages_mo.group("pages")) if pages_mo else None,
+        fonts=list(dict.fromkeys(_FONTSPEC_FONT.findall(log))),
+        font_files=list(
+            dict.fromkeys(os.path.basename(path) for path in _FONT_FILE.findall(log))
+        ),
+        boxes=boxes,
+        error=error,
+    )
+
+
+def _unwrap(log: str) -> str:
+    # join the lines TeX broke at MAX_PRINT_LINE, so that messages can be
+    # matched whole; a line of that length may also be a whole message, in
+    # which case the next line is blank or starts a message of its own
+    lines = log.split("\n")
+    unwrapped = []
+    pending = ""
+    for line, next_line in zip(lines, [*lines[1:], ""]):
+        pending += line
+        wrapped = len(line.encode("utf-8")) == MAX_PRINT_LINE
+        if not (wrapped and next_line and not _MESSAGE_START.match(next_line)):
+            unwrapped.append(pending)
+            pending = ""
+    return "\n".join(unwrapped)
+
+
+def _sections(tex_lines: list[str]) -> list[str]:
+    # the title of the section each line of a document is in
+    sections = []
+    title = ""
+    for line in tex_lines:
+        if mo := _SECTION.match(line.strip()):
+            title = mo.group("title")
+        sections.append(title)
+    return sections
+
+
+def layout_changes(old: CompileRecord, new: CompileRecord) -> list[str]:
+    """How the layout of `new` has got worse than that of `old`, the same
+    document compiled before: more pages, or overfull boxes in entries that
+    had none."""
+    changes = []
+    if old.pages is not None and new.pages is not None and new.pages > old.pages:
+        changes.append(f"{old.pages} -> {new.pages} pages")
+    old_sources = {box.source for box in old.overfull}
+    changes += [
+        f"New: {box.describe()}"
+        for box in new.overfull
+        if box.source not in old_sources
+    ]
+    return changes
+
+
+def timing_summary(records: typing.Iterable[CompileRecord]) -> str:
+    """Where the compile time of `records` went: first passes, reruns, and
+    the slowest documents."""
+    records = list(records)
+    if not records:
+        return "No compiles recorded"
+    first = [record.pass_seconds[0] for record in records if record.pass_seconds]
+    reruns = [seconds for record in records for seconds in record.pass_seconds[1:]]
+    total = sum(first) + sum(reruns)
+    lines = [
+        f"{len(records)} compiles, {len(first) + len(reruns)} passes, {total:.1f} s",
+        f"First passes: {sum(first):.1f} s, {_mean(first):.2f} s each",
+        f"Reruns: {sum(reruns):.1f} s, {_mean(reruns):.2f} s each",
+    ]
+    slowest = sorted(records, key=lambda record: record.seconds, reverse=True)[:3]
+    lines += [
+        f"Slow: {record.document} ({record.seconds:.1f} s, {len(record.pass_seconds)}"
+        " pass(es))"
+        for record in slowest
+    ]
+    return "\n".join(lines)
+
+
+def _mean(values: list[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+class LogStore:
+    """Compile records in a JSON lines file, which keeps the latest
+    `max_records` or so, the oldest dropped first. Records can be added
+    from any thread."""
+
+    def __init__(self, path: str = COMPILE_LOG_PATH, max_records: int = MAX_RECORDS):
+        self.path = path
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._count = None  # records in the file, counted on the first add
+
+    def add(self, record: CompileRecord):
+        line = json.dumps(dataclasses.asdict(record), ensure_ascii=False)
+        with self._lock:
+            if self._count is None:
+                self._count = len(self._read_lines())
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(f"{line}\n")
+            self._count += 1
+            # trimmed in bulk, so that most adds are a single append
+            if self._count > self.max_records + self.max_records // 4:
+                self._trim()
+
+    def records(self) -> list[CompileRecord]:
+        """All the records kept, the oldest first."""
+        with self._lock:
+            lines = self._read_lines()
+        records = []
+        for line in lines:
+            try:
+                records.append(CompileRecord.from_dict(json.loads(line)))
+            except (ValueError, TypeError):
+                continue  # e.g. a line cut short by a crash
+        return records
+
+    def latest(self) -> dict[str, CompileRecord]:
+        """The latest record of each document."""
+        return {record.document: record for record in self.records()}
+
+    def _read_lines(self) -> list[str]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return [line for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _trim(self):
+        lines = self._read_lines()[-self.max_records :]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+        self._count = len(lines)
@@ -3,6 +3,11 @@ import datetime
 import re
 import json
 import functools
+import typing
+import os
+import mmap
+import threading
+import concurrent.futures
 
 
 class ParsingError(ValueError):
@@ -13,47 +18,81 @@ class DateError(ParsingError):
     pass
 
 
-def _compile(keyword):
-    return re.compile(rf"^\s*{keyword}\s*[:：](.*)$", flags=re.IGNORECASE)
-
-
 ACADEMIC_TESTS = ["SAT", "ACT", "GRE", "GMAT"]
 ENGLISH_TESTS = ["TOEFL", "IELTS", "DET", "Duolingo"]
 
-NAME = _compile("name")
-EMAIL = _compile("email")
-PHONE = _compile("phone")
-ADDRESS = _compile("address")
-WEBSITE = _compile("website")
-
-SECTION = re.compile(r"^\s*#\s*(.+)$")
-LOC = _compile("loc")
-START_DATE = _compile(r"start\s+date")
-END_DATE = _compile(r"end\s+date")
-
-SCHOOL = _compile("school")
-DEGREE = _compile("degree")
-MAJOR = _compile("major")
-MINOR = _compile("minor")
-GPA = _compile("gpa")
-RANK = _compile("rank")
-COURSES = _compile("courses")
-
-ROLE = _compile("role")
-ORG = _compile("org")
-HOURS = _compile(r"hours\s+per\s+week")
-WEEKS = _compile(r"weeks\s+per\s+year")
-DESCRIPTION = re.compile(r"^\s*[-•]\s*(.+)$")
-
-AWARD = _compile("award")
+# Keyword schema: keyword -> (target, attribute)
+# - "cv": the keyword sets an attribute of the cv itself
+# - "entry": the keyword sets an attribute of the current entry
+# - "date": same as "entry", but the value is parsed as a SmartDate
+# - name of an entry class: the keyword starts a new entry of that class
+# Keywords are case-insensitive; words may be separated by any whitespace.
+SCHEMA = {
+    "name": ("cv", "name"),
+    "email": ("cv", "email"),
+    "phone": ("cv", "phone"),
+    "address": ("cv", "address"),
+    "website": ("cv", "website"),
+    "school": ("Education", "school"),
+    "role": ("Activity", "role"),
+    "award": ("Award", "name"),
+    "test": ("Test", "name"),
+    "skillset name": ("SkillSet", "name"),
+    "loc": ("entry", "loc"),
+    "start date": ("date", "start_date"),
+    "end date": ("date", "end_date"),
+    "award date": ("date", "date"),
+    "test date": ("date", "date"),
+    "degree": ("entry", "degree"),
+    "major": ("entry", "major"),
+    "minor": ("entry", "minor"),
+    "gpa": ("entry", "gpa"),
+    "rank": ("entry", "rank"),
+    "courses": ("entry", "courses"),
+    "org": ("entry", "org"),
+    "hours per week": ("entry", "hours_per_week"),
+    "weeks per year": ("entry", "weeks_per_year"),
+    "score": ("entry", "score"),
+    "skills": ("entry", "skills"),
+}
+
+# regex patterns of the keywords, longest first, so that an alternation
+# of them never stops at a keyword that is a prefix of another
+KEYWORD_PATTERNS = sorted(
+    (r"\s+".join(map(re.escape, kw.split())) for kw in SCHEMA),
+    key=len,
+    reverse=True,
+)
 
-TEST = _compile("test")
-SCORE = _compile("score")
+# A single pattern classifying a (whitespace-normalized) line as a section
+# heading, a description, or a keyword followed by its value
+LINE = re.compile(
+    r"^(?:#\s*(?P<section>.+)"
+    r"|[-•]\s*(?P<description>.+)"
+    rf"|(?P<keyword>{'|'.join(KEYWORD_PATTERNS)})\s*[:：](?P<value>.*))$",
+    flags=re.IGNORECASE,
+)
 
-X_DATE = _compile(r"(?:award|test)\s+date")
+# Line break followed by a line starting with a keyword that starts a new
+# entry. Line breaks are those recognized by str.splitlines(), so that the
+# lines found here are the lines seen by the parser.
+_LINE_BREAKS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+_INLINE_SPACE = rf"[^\S{_LINE_BREAKS}]"
+ENTRY_START = re.compile(
+    rf"[{_LINE_BREAKS}]{_INLINE_SPACE}*(?:"
+    + "|".join(
+        f"{_INLINE_SPACE}+".join(map(re.escape, keyword.split()))
+        for keyword, (target, _) in SCHEMA.items()
+        if target not in ("cv", "entry", "date")
+    )
+    + rf"){_INLINE_SPACE}*[:：]",
+    flags=re.IGNORECASE,
+)
 
-SKILLSET_NAME = _compile(r"skillset\s+name")
-SKILLS = _compile("skills")
+# In multi-cv container files, cvs are separated by lines consisting of
+# three or more equal signs
+RECORD_SEPARATOR = re.compile(rb"^[ \t]*={3,}[ \t]*\r?$", flags=re.MULTILINE)
+_NON_BLANK = re.compile(rb"\S")
 
 
 # Model files
@@ -127,13 +166,29 @@ Website:
 )
 
 
+_DATE = re.compile(r"^(\d{4})(?:([-./])([01]?[0-9])(?:\2([0-3]?[0-9]))?)?$")
+
+# sort key of SmartDates that are not dates; greater than any yyyy0000
+_NOT_A_DATE = 10000
+
+
 @functools.total_ordering
-@dataclasses.dataclass
+@dataclasses.dataclass(frozen=True, slots=True)
 class SmartDate:
     year: int = None
     month: int = None
     day: int = None
     fallback: str = ""
+    # yyyymmdd, with 0 for a missing month or day; derived from the above
+    sort_key: int = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        sort_key = (
+            (self.year or _NOT_A_DATE) * 10000
+            + (self.month or 0) * 100
+            + (self.day or 0)
+        )
+        object.__setattr__(self, "sort_key", sort_key)
 
     def __str__(self):
         if self.resolution == "day":
@@ -148,7 +203,10 @@ class SmartDate:
         return bool(self.is_date or self.fallback)
 
     def __eq__(self, other: "SmartDate"):
-        return (
+        # parsed dates are interned, so equal dates are usually identical
+        if self is other:
+            return True
+        return self.sort_key == other.sort_key and (
             self.year,
             self.month,
             self.day,
@@ -164,17 +222,9 @@ class SmartDate:
         # - non-date > date
         # - later date > earlier date
         # - more precise date > less precise date
-        return (
-            self.year or float("inf"),
-            self.month or -1,
-            self.day or -1,
-            self.fallback.lower(),
-        ) < (
-            other.year or float("inf"),
-            other.month or -1,
-            other.day or -1,
-            other.fallback.lower(),
-        )
+        if self.sort_key != other.sort_key:
+            return self.sort_key < other.sort_key
+        return self.fallback.lower() < other.fallback.lower()
 
     @property
     def is_date(self):
@@ -197,12 +247,19 @@ class SmartDate:
         return datetime.date(self.year, self.month, self.day or 1)
 
     @classmethod
+    @functools.lru_cache(maxsize=4096)
     def from_str(cls, s: str):
+        # a string seen recently is not parsed again; equal dates parsed from
+        # different strings share one instance
+        return intern_date(cls._from_str(s))
+
+    @classmethod
+    def _from_str(cls, s: str):
         # TODO parse the date string step by step
         # try splitting with '-' or '/' or '.'
         # if splitting into two or three: try yyyy-mm or yyyy-mm-dd
         # if splitting into one: try year; if not, fallback
-        mo = re.match(r"^(\d{4})(?:([-./])([01]?[0-9])(?:\2([0-3]?[0-9]))?)?$", s)
+        mo = _DATE.match(s)
         if mo is None:
             return cls(fallback=s)
 
@@ -212,7 +269,7 @@ class SmartDate:
             return cls(year=year)
 
         month = int(month)
-        if month not in set(range(1, 13)):
+        if not 1 <= month <= 12:
             raise DateError("month out of range")
         if day is None:
             return cls(year=year, month=month)
@@ -226,8 +283,27 @@ class SmartDate:
             return cls(year=year, month=month, day=day)
 
 
+# Equal dates share one instance, up to this many distinct dates; past
+# that, the dates interned first are forgotten, as every fallback string
+# ever parsed would otherwise be kept
+MAX_INTERNED_DATES = 65536
+_interned_dates = {}
+_interned_dates_lock = threading.Lock()
+
+
+def intern_date(date: SmartDate) -> SmartDate:
+    """The instance shared by dates equal to `date`."""
+    with _interned_dates_lock:
+        interned = _interned_dates.get(date)
+        if interned is None:
+            if len(_interned_dates) >= MAX_INTERNED_DATES:
+                del _interned_dates[next(iter(_interned_dates))]
+            interned = _interned_dates[date] = date
+        return interned
+
+
 @functools.total_ordering
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Education:
     school: str
     loc: str = ""
@@ -261,7 +337,7 @@ class Education:
 
 
 @functools.total_ordering
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Activity:
     role: str
     org: str = ""
@@ -281,7 +357,7 @@ class Activity:
 
 
 @functools.total_ordering
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Award:
     name: str
     date: SmartDate = SmartDate()
@@ -294,7 +370,7 @@ class Award:
 
 
 @functools.total_ordering
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class Test:
     name: str
     score: str = ""
@@ -315,135 +391,378 @@ class Test:
         return self.name in ENGLISH_TESTS
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class SkillSet:
     name: str
     skills: str = ""
 
 
-@dataclasses.dataclass
+_STALE = object()
+
+
+class _IndexedList(list):
+    """A list of entries with an index of them, which is rebuilt when next
+    needed after the list has changed. Subclasses build the index in
+    `_build_index()`."""
+
+    __slots__ = ("_index",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._index = _STALE
+
+    def indexed(self):
+        if self._index is _STALE:
+            self._index = self._build_index()
+        return self._index
+
+    def reindex(self):
+        self._index = self._build_index()
+
+    def __reduce__(self):
+        # pickle and copy the entries only; the index is rebuilt when needed
+        return type(self), (list(self),)
+
+
+def _discarding_index(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._index = _STALE
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+for _method_name in [
+    "append",
+    "extend",
+    "insert",
+    "remove",
+    "pop",
+    "clear",
+    "sort",
+    "reverse",
+    "__setitem__",
+    "__delitem__",
+    "__iadd__",
+    "__imul__",
+]:
+    setattr(
+        _IndexedList,
+        _method_name,
+        _discarding_index(getattr(list, _method_name)),
+    )
+del _method_name
+
+
+class _EducationList(_IndexedList):
+    __slots__ = ()
+
+    def _build_index(self) -> Education | None:
+        # the latest education; of equally late ones, the last listed
+        latest = None
+        for edu in self:
+            if latest is None or not edu < latest:
+                latest = edu
+        return latest
+
+
+class _ActivityList(_IndexedList):
+    __slots__ = ()
+
+    def _build_index(self) -> dict[str, list[Activity]]:
+        # section -> activities of the section
+        sections = {}
+        for activity in self:
+            sections.setdefault(activity.section, []).append(activity)
+        return sections
+
+
+class _TestList(_IndexedList):
+    __slots__ = ()
+
+    def _build_index(self) -> tuple[list[Test], list[Test]]:
+        # academic tests, english tests
+        return (
+            [t for t in self if t.name in ACADEMIC_TESTS],
+            [t for t in self if t.is_language],
+        )
+
+
+# cv attribute -> type of indexed list to hold it
+_INDEXED_LISTS = {
+    "education": _EducationList,
+    "activities": _ActivityList,
+    "tests": _TestList,
+}
+
+
+@dataclasses.dataclass(slots=True)
 class CV:
     name: str = ""
     email: str = ""
     address: str = ""
     phone: str = ""
     website: str = ""
-    education: list[Education] = dataclasses.field(default_factory=list)
+    education: list[Education] = dataclasses.field(default_factory=_EducationList)
     activity_sections: list[str] = dataclasses.field(default_factory=list)
-    activities: list[Activity] = dataclasses.field(default_factory=list)
+    activities: list[Activity] = dataclasses.field(default_factory=_ActivityList)
     awards: list[Award] = dataclasses.field(default_factory=list)
-    tests: list[Test] = dataclasses.field(default_factory=list)
+    tests: list[Test] = dataclasses.field(default_factory=_TestList)
     skillsets: list[SkillSet] = dataclasses.field(default_factory=list)
 
+    def __setattr__(self, name, value):
+        # lists of entries assigned to the cv are copied into indexed lists
+        if name in _INDEXED_LISTS and type(value) is not _INDEXED_LISTS[name]:
+            value = _INDEXED_LISTS[name](value)
+        object.__setattr__(self, name, value)
+
+    def reindex(self):
+        # The indexes follow changes to the lists of entries; this is needed
+        # only after changing the section, dates or name of an entry in place
+        for attr in _INDEXED_LISTS:
+            getattr(self, attr).reindex()
+
     @property
     def last_education(self):
-        if not self.education:
-            return
-        return sorted(self.education)[-1]
+        return self.education.indexed()
 
     def academic_tests(self) -> list[Test]:
-        return [t for t in self.tests if t.name in ACADEMIC_TESTS]
+        academic_tests, _ = self.tests.indexed()
+        return list(academic_tests)
 
     def english_tests(self) -> list[Test]:
-        return [t for t in self.tests if t.is_language]
+        _, english_tests = self.tests.indexed()
+        return list(english_tests)
 
     def activities_of_section(self, section: str = ""):
-        return [a for a in self.activities if a.section == section]
+        return list(self.activities.indexed().get(section, []))
 
     def to_json(self, indent=4):
-        return json.dumps(dataclasses.asdict(self), indent=indent)
+        data = dataclasses.asdict(self, dict_factory=_dict_without_derived_fields)
+        return json.dumps(data, indent=indent)
+
+
+def _dict_without_derived_fields(items: list[tuple]) -> dict:
+    return {k: v for k, v in items if k != "sort_key"}
+
+
+# entry class name -> (entry class, cv attribute holding such entries)
+_ENTRY_TYPES = {
+    "Education": (Education, "education"),
+    "Activity": (Activity, "activities"),
+    "Award": (Award, "awards"),
+    "Test": (Test, "tests"),
+    "SkillSet": (SkillSet, "skillsets"),
+}
+_CV_LISTS = {entry_class: cv_attr for entry_class, cv_attr in _ENTRY_TYPES.values()}
+
+# the classes of the entries of a cv, in the order of their lists in CV
+ENTRY_CLASSES = tuple(entry_class for entry_class, _ in _ENTRY_TYPES.values())
 
 
 def parse(src: str) -> tuple[CV, list[str]]:
     cv = CV()
     unparsed = []
+    for entry in parse_iter(src.splitlines(), cv=cv, unparsed=unparsed):
+        getattr(cv, _CV_LISTS[type(entry)]).append(entry)
+    cv.reindex()
+    return cv, unparsed
+
+
+def parse_iter(
+    lines: typing.Iterable[str],
+    *,
+    cv: CV | None = None,
+    unparsed: list[str] | None = None,
+    section: str = "",
+) -> typing.Iterator[Education | Activity | Award | Test | SkillSet]:
+    """Yield each entry as soon as the next entry (or the end of `lines`)
+    closes it. Personal information and activity sections go to `cv`, and
+    unparsable lines to `unparsed`; the entries themselves are not kept.
+    A field of another kind of entry than the one it follows, e.g. "GPA:"
+    after "role:", is unparsable, as the slotted entries have no room for
+    it; it used to be set on the entry and never shown.
+    `section` is the activity section in effect at the start of `lines`.
+    """
+    if cv is None:
+        cv = CV()
+    if unparsed is None:
+        unparsed = []
     curren_data_object = None
-    current_section = ""
+    current_section = section
 
-    for line in src.splitlines():
-        line = re.sub(r"\s+", " ", line).strip()
+    for line in lines:
+        line = " ".join(line.split())
 
         if not line:
             continue
 
+        mo = LINE.match(line)
+        if mo is None:
+            unparsed.append(line)
+            continue
+
         try:
-            if (name := _match(NAME, line)) is not None:
-                cv.name = name
-            elif (email := _match(EMAIL, line)) is not None:
-                cv.email = email
-            elif (phone := _match(PHONE, line)) is not None:
-                cv.phone = phone
-            elif (address := _match(ADDRESS, line)) is not None:
-                cv.address = address
-            elif (website := _match(WEBSITE, line)) is not None:
-                cv.website = website
-
-            elif (new_section := _match(SECTION, line)) is not None:
-                current_section = new_section
+            if (new_section := mo["section"]) is not None:
+                current_section = new_section.strip()
                 cv.activity_sections.append(current_section)
-            elif (school := _match(SCHOOL, line)) is not None:
-                curren_data_object = Education(school=school)
-                cv.education.append(curren_data_object)
-            elif (role := _match(ROLE, line)) is not None:
-                curren_data_object = Activity(role=role, section=current_section)
-                cv.activities.append(curren_data_object)
-            elif (skillset_name := _match(SKILLSET_NAME, line)) is not None:
-                curren_data_object = SkillSet(name=skillset_name)
-                cv.skillsets.append(curren_data_object)
-            elif (award_name := _match(AWARD, line)) is not None:
-                curren_data_object = Award(name=award_name)
-                cv.awards.append(curren_data_object)
-            elif (test_name := _match(TEST, line)) is not None:
-                curren_data_object = Test(name=test_name)
-                cv.tests.append(curren_data_object)
-
-            elif (loc := _match(LOC, line)) is not None:
-                curren_data_object.loc = loc
-            elif (start_date := _match(START_DATE, line)) is not None:
-                curren_data_object.start_date = SmartDate.from_str(start_date)
-            elif (end_date := _match(END_DATE, line)) is not None:
-                curren_data_object.end_date = SmartDate.from_str(end_date)
-            elif (x_date := _match(X_DATE, line)) is not None:
-                curren_data_object.date = SmartDate.from_str(x_date)
-
-            elif (degree := _match(DEGREE, line)) is not None:
-                curren_data_object.degree = degree
-            elif (major := _match(MAJOR, line)) is not None:
-                curren_data_object.major = major
-            elif (minor := _match(MINOR, line)) is not None:
-                curren_data_object.minor = minor
-            elif (gpa := _match(GPA, line)) is not None:
-                curren_data_object.gpa = gpa
-            elif (rank := _match(RANK, line)) is not None:
-                curren_data_object.rank = rank
-            elif (courses := _match(COURSES, line)) is not None:
-                curren_data_object.courses = courses
-
-            elif (org := _match(ORG, line)) is not None:
-                curren_data_object.org = org
-            elif (hours := _match(HOURS, line)) is not None:
-                curren_data_object.hours_per_week = hours
-            elif (weeks := _match(WEEKS, line)) is not None:
-                curren_data_object.weeks_per_year = weeks
-            elif (description := _match(DESCRIPTION, line)) is not None:
-                curren_data_object.descriptions.append(description)
-
-            elif (score := _match(SCORE, line)) is not None:
-                curren_data_object.score = score
-            elif (skills := _match(SKILLS, line)) is not None:
-                curren_data_object.skills = skills
-
+            elif (description := mo["description"]) is not None:
+                curren_data_object.descriptions.append(description.strip())
             else:
-                unparsed.append(line)
+                target, attr = SCHEMA[mo["keyword"].lower()]
+                value = mo["value"].strip()
+                if target == "cv":
+                    setattr(cv, attr, value)
+                elif target in _ENTRY_TYPES:
+                    if curren_data_object is not None:
+                        yield curren_data_object
+                    entry_class, _ = _ENTRY_TYPES[target]
+                    curren_data_object = entry_class(**{attr: value})
+                    if entry_class is Activity:
+                        curren_data_object.section = current_section
+                elif curren_data_object is not None and not hasattr(
+                    curren_data_object, attr
+                ):
+                    # a field of another type of entry
+                    unparsed.append(line)
+                elif target == "date":
+                    setattr(curren_data_object, attr, SmartDate.from_str(value))
+                else:
+                    setattr(curren_data_object, attr, value)
 
         except DateError:
             raise DateError(f"Wrong date in line: {line!r}")
         except Exception as e:
             raise ParsingError(f"Unparsable line: {line!r}\n{e}")
 
-    return cv, unparsed
-
-
-def _match(compiled_pattern: re.Pattern, text: str):
-    if mo := compiled_pattern.match(text):
-        return mo.group(1).strip()
+    if curren_data_object is not None:
+        yield curren_data_object
+
+
+def parse_many(
+    path: str, *, max_workers: int | None = None
+) -> list[tuple[CV, list[str]] | ParsingError]:
+    """Parse every cv in a multi-cv container file on a pool of processes.
+
+    Records are located on a memory map of the file; the workers are sent
+    only the byte offsets of the records, and read the records themselves.
+
+    A record that fails to parse is returned as a ParsingError in place of
+    its (cv, unparsed lines); the other records are parsed all the same.
+    """
+    if not os.path.getsize(path):
+        return []
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            spans = _record_spans(mm)
+    if not spans:
+        return []
+
+    max_workers = max_workers or os.cpu_count() or 1
+    batch_size = -(-len(spans) // (max_workers * 4))  # ceiling division
+    batches = [spans[i : i + batch_size] for i in range(0, len(spans), batch_size)]
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(_parse_records, path, batch) for batch in batches]
+        for future, batch in zip(futures, batches):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                # e.g. a worker died; every record of its batch failed
+                error = ParsingError(f"{type(e).__name__}: {e}")
+                results.extend(error for _ in batch)
+    return results
+
+
+def _record_spans(buffer) -> list[tuple[int, int]]:
+    # (start, end) byte offsets of the non-blank records in `buffer`
+    spans = []
+    start = 0
+    for mo in RECORD_SEPARATOR.finditer(buffer):
+        spans.append((start, mo.start()))
+        start = mo.end()
+    spans.append((start, len(buffer)))
+    return [(s, e) for s, e in spans if _NON_BLANK.search(buffer, s, e)]
+
+
+def _parse_records(path: str, spans: list[tuple[int, int]]):
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [_parse_record(mm[s:e]) for s, e in spans]
+
+
+def _parse_record(record: bytes) -> tuple[CV, list[str]] | ParsingError:
+    try:
+        return parse(record.decode("utf-8-sig"))
+    except UnicodeDecodeError as e:
+        return ParsingError(f"Not utf-8: {e}")
+    except ParsingError as e:
+        return e
+
+
+class IncrementalParser:
+    """Parse successive versions of a source, such as the editor text,
+    re-parsing only the entry blocks that changed since the last version.
+
+    A block runs from a line starting a new entry to the next such line.
+    Parsed blocks are cached by their text and the activity section in
+    effect at their start, which is all their parsing depends on.
+    """
+
+    def __init__(self):
+        # (block text, section) -> (entries, cv fields, sections, unparsed)
+        self._cache = {}
+
+    def parse(self, src: str) -> tuple[CV, list[str]]:
+        cv = CV()
+        unparsed = []
+        section = ""
+        cache = {}
+
+        for block in split_blocks(src):
+            key = (block, section)
+            try:
+                parsed = self._cache[key]
+            except KeyError:
+                parsed = _parse_block(block, section)
+            cache[key] = parsed
+
+            entries, cv_fields, sections, block_unparsed = parsed
+            for entry in entries:
+                getattr(cv, _CV_LISTS[type(entry)]).append(entry)
+            for attr, value in cv_fields:
+                setattr(cv, attr, value)
+            cv.activity_sections.extend(sections)
+            unparsed.extend(block_unparsed)
+            if sections:
+                section = sections[-1]
+
+        # keep the blocks of the latest version only
+        self._cache = cache
+        cv.reindex()
+        return cv, unparsed
+
+
+def split_blocks(src: str) -> list[str]:
+    """Split `src` before every line that starts a new entry."""
+    # With a line break prepended, the offset of each matched line break
+    # is the offset in `src` of the line following it
+    starts = (mo.start() for mo in ENTRY_START.finditer(f"\n{src}"))
+    bounds = [0, *starts, len(src)]
+    return [src[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def _parse_block(block: str, section: str):
+    # fields left as None are those not set in the block
+    cv = CV(**{attr: None for target, attr in SCHEMA.values() if target == "cv"})
+    unparsed = []
+    entries = tuple(
+        parse_iter(block.splitlines(), cv=cv, unparsed=unparsed, section=section)
+    )
+    cv_fields = tuple(
+        (attr, value)
+        for target, attr in SCHEMA.values()
+        if target == "cv" and (value := getattr(cv, attr)) is not None
+    )
+    return entries, cv_fields, tuple(cv.activity_sections), tuple(unparsed)